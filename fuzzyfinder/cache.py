@@ -0,0 +1,135 @@
+from collections import OrderedDict
+import threading
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FTSResultCache:
+    """
+    A least-recently-used cache of FTS query results, shared by all searches in this process.
+
+    Keys are (namespace, frozenset of tokens, individual_search_limit), where the namespace identifies the
+    database.  Writes through a SearchDatabase invalidate that database's entries.  Writes made by other
+    processes are not detected, so clear the cache if another process writes to a database you're searching.
+    """
+
+    def __init__(self, max_entries: int = 100_000, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            max_entries (int, optional): The maximum number of query results to keep.  Set to 0 to disable
+                the cache.  Defaults to 100,000.
+            max_bytes (int, optional): The maximum estimated size of the cached results.  Defaults to 256MB.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached results for key, or None if they aren't cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, results):
+        size = _results_size(results)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if self.max_entries <= 0 or size > self.max_bytes:
+                return
+            self._entries[key] = (results, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+
+    def invalidate(self, namespace):
+        """Remove all cached results for a database"""
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == namespace]
+            for key in keys:
+                self.bytes -= self._entries.pop(key)[1]
+        if keys:
+            logger.debug(f"Invalidated {len(keys):,.0f} cached FTS results")
+
+    def clear(self):
+        """Remove all cached results and reset the hit and miss counts"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+
+class TokenProportionCache:
+    """
+    A least-recently-used cache of the token proportions looked up from one database's {col}_token_counts
+    views, keyed by (token, column).  Each SearchDatabase has its own, which it clears whenever it changes the
+    token counts.  As with FTSResultCache, writes made by other processes are not detected
+    """
+
+    def __init__(self, max_entries: int = 1_000_000):
+        """
+        Args:
+            max_entries (int, optional): The maximum number of token proportions to keep.  Defaults to 1,000,000.
+        """
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None if it isn't cached"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _results_size(results):
+    """An estimate of the memory used by a list of FTS result rows"""
+    size = 64
+    for r in results:
+        size += 200 + len(r.get("original_record") or "")
+    return size
+
+
+fts_result_cache = FTSResultCache()
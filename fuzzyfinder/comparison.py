@@ -1,8 +1,15 @@
+from collections import Counter
+from functools import lru_cache
 from math import log10
 import logging
 
 from .leven import levenshtein_distance
 
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -10,30 +17,102 @@ def leven_ratio(str_1, str_2):
     return 1 - levenshtein_distance(str_1, str_2) / max(len(str_1), len(str_2))
 
 
+# Tokens are potential misspellings of each other if their leven_ratio is above this
+MISSPELLING_RATIO = 0.65
+
+
+@lru_cache(maxsize=int(1e6))
+def is_misspelling(token_from_search_record, token):
+    """Whether leven_ratio(token_from_search_record, token) > MISSPELLING_RATIO.  Results are cached, since the
+    same pairs of tokens are compared for many candidate records
+
+    The edit distance is at least the difference in the tokens' lengths, and at least the length of the
+    longer token minus the number of characters they have in common.  Most pairs are ruled out by these
+    bounds without computing the distance"""
+    max_len = max(len(token_from_search_record), len(token))
+    if max_len == 0:
+        return False
+    min_len = min(len(token_from_search_record), len(token))
+    if min_len / max_len <= MISSPELLING_RATIO:
+        return False
+
+    common = sum((Counter(token_from_search_record) & Counter(token)).values())
+    if common / max_len <= MISSPELLING_RATIO:
+        return False
+
+    return leven_ratio(token_from_search_record, token) > MISSPELLING_RATIO
+
+
 # Another possibility would be to use something like
 # https://github.com/simonw/sqlite-fts4/blob/9f4912f078d47a87aa534b3e835a3422a6d4ad96/sqlite_fts4/__init__.py#L221
 
 
+class PreparedSearchRecord:
+    """
+    Everything about a search record that's needed to score potential matches against it, worked out once so
+    that scoring each potential match only touches the potential match's own data.
+
+    Only the search record's token proportions are needed to score a potential match, because every token
+    that contributes to the score is one of the search record's tokens
+    """
+
+    def __init__(self, search_rec):
+        """
+        Args:
+            search_rec (Record): The search record
+        """
+        self.search_rec = search_rec
+        self.columns = search_rec.columns_to_index
+        self.tokens = search_rec.tokenised_including_mispellings
+        self.token_sets = {col: set(tokens) for col, tokens in self.tokens.items()}
+        self.token_probabilities = search_rec.token_probabilities
+
+        # For BatchRecordScorer, each column's search tokens that can contribute to the score, with their
+        # positions in weights, where weights are -log10 of the tokens' proportions
+        self.weighted_tokens = {}
+        self.weights = []
+        self.is_zero_probability = []
+        for col in self.columns:
+            col_tokens = []
+            for t in dict.fromkeys(self.tokens[col]):
+                p = self.token_probabilities[col][t]["proportion"]
+                # A token that isn't in the database leaves the probability unchanged
+                if p == "does_not_exist_in_db" or p == 1:
+                    continue
+                col_tokens.append((t, len(self.weights)))
+                self.weights.append(-log10(p) if p > 0 else 0.0)
+                self.is_zero_probability.append(not p > 0)
+            self.weighted_tokens[col] = col_tokens
+
+    def has_misspelling(self, token_from_search_record, potential_match_tokens):
+        """Whether any of potential_match_tokens is a potential misspelling of token_from_search_record"""
+        for t in potential_match_tokens:
+            if is_misspelling(token_from_search_record, t):
+                # logger.debug(f'Token {token_from_search_record} is misspelling of {t}')
+                return True
+        return False
+
+
 class RecordComparisonScorer:
-    def __init__(self, search_rec, potenital_match_rec):
+    def __init__(self, search_rec, potenital_match_rec, prepared_search_rec=None):
+        """
+        Args:
+            search_rec (Record): The search record
+            potenital_match_rec (Record): The potential match to score
+            prepared_search_rec (PreparedSearchRecord, optional): search_rec prepared for scoring, which should
+                be reused when scoring many potential matches.  Defaults to None, meaning one is created
+        """
         self.search_rec = search_rec
         self.potenital_match_rec = potenital_match_rec
+        self.prepared_search_rec = prepared_search_rec or PreparedSearchRecord(
+            search_rec
+        )
 
-        self.search_rec_tkns = search_rec.tokenised_including_mispellings
+        self.search_rec_tkns = self.prepared_search_rec.tokens
         self.potential_match_rec_tkns = (
             potenital_match_rec.tokenised_including_mispellings
         )
-
-        # Create dict of token probs from both records
-        token_probs_s = search_rec.token_probabilities
-        token_probs_p = potenital_match_rec.token_probabilities
-        self.token_probs = {}
-        for col in token_probs_p:
-            try:
-                self.token_probs[col] = {**token_probs_p[col], **token_probs_s[col]}
-            # If this column not specified in serach record
-            except KeyError:
-                self.token_probs[col] = token_probs_p[col]
+        self.token_probs = self.prepared_search_rec.token_probabilities
 
     @property
     def score(self):
@@ -41,7 +120,7 @@ class RecordComparisonScorer:
         # logger.debug('starting scoring')
         # logger.debug(f'search rec is {self.search_rec.record_dict}')
         # logger.debug(f'comparison rec is {self.potenital_match_rec.record_dict}')
-        for col in self.search_rec.columns_to_index:
+        for col in self.prepared_search_rec.columns:
             # logger.debug(f'scoring col {col}')
             p = self.column_probability(col)
             probability = probability * p
@@ -50,7 +129,7 @@ class RecordComparisonScorer:
 
     def column_probability(self, col):
 
-        col_search_tkns = set(self.search_rec_tkns[col])
+        col_search_tkns = self.prepared_search_rec.token_sets[col]
         col_potential_match_tkns = set(self.potential_match_rec_tkns[col])
 
         matching_tokens = col_search_tkns.intersection(col_potential_match_tkns)
@@ -100,14 +179,160 @@ class RecordComparisonScorer:
             return 1 / prob
 
     def token_is_misspelling(self, col, token_from_search_record):
-        for t in self.potential_match_rec_tkns[col]:
-            if leven_ratio(token_from_search_record, t) > 0.65:
-                # logger.debug(f'Token {token_from_search_record} is misspelling of {t}')
-                return True
-        return False
+        return self.prepared_search_rec.has_misspelling(
+            token_from_search_record, self.potential_match_rec_tkns[col]
+        )
 
     @staticmethod
     def prob_to_score(prob):
         if prob == 0.0:
             return -20
         return -(log10(prob)) / 30
+
+
+# BatchRecordScorer leaves potential matches to RecordComparisonScorer if their probability could overflow or
+# underflow a float, so that its handling of those cases is reproduced exactly
+_MAX_LOG_PROBABILITY = 300
+
+
+class BatchRecordScorer:
+    """
+    Scores many potential matches against one search record, giving the same scores as RecordComparisonScorer
+    to within floating point rounding.
+
+    The score is -log10 of the product of token probabilities, divided by 30, so it is a sum with a term for
+    each search token of weight w = -log10(proportion).  The term is +w if the potential match contains the
+    token, 0 if it contains a misspelling of it, and -w otherwise.
+
+    If numpy is installed, the potential matches' tokens are encoded as integer ids, so that which search
+    tokens each potential match contains, or contains a misspelling of, is found with array operations over all
+    the potential matches at once.  Each distinct token is only compared with each search token once.
+    Otherwise the terms are found for one potential match at a time
+    """
+
+    def __init__(self, search_rec, prepared_search_rec=None):
+        """
+        Args:
+            search_rec (Record): The search record
+            prepared_search_rec (PreparedSearchRecord, optional): search_rec prepared for scoring.  Defaults to
+                None, meaning one is created
+        """
+        self.search_rec = search_rec
+        self.prepared_search_rec = prepared_search_rec or PreparedSearchRecord(
+            search_rec
+        )
+
+    def _terms(self, potential_match_rec):
+        """The sign of each search token's term in the score of potential_match_rec"""
+        prepared = self.prepared_search_rec
+        potential_match_rec_tkns = potential_match_rec.tokenised_including_mispellings
+
+        signs = [0] * len(prepared.weights)
+        for col, col_tokens in prepared.weighted_tokens.items():
+            col_potential_match_tkns = potential_match_rec_tkns.get(col, [])
+            col_potential_match_set = set(col_potential_match_tkns)
+            for t, position in col_tokens:
+                if t in col_potential_match_set:
+                    signs[position] = 1
+                elif not prepared.has_misspelling(t, col_potential_match_tkns):
+                    signs[position] = -1
+        return signs
+
+    def _sums(self, potential_match_recs):
+        """For each potential match, the sum of its terms, the sum of their magnitudes, and whether any of them
+        has a token proportion of zero"""
+        prepared = self.prepared_search_rec
+        signs = [self._terms(rec) for rec in potential_match_recs]
+
+        log_probabilities = [
+            sum(s * w for s, w in zip(row, prepared.weights)) for row in signs
+        ]
+        magnitudes = [
+            sum(w for s, w in zip(row, prepared.weights) if s) for row in signs
+        ]
+        uses_zero_probability = [
+            any(s and zero for s, zero in zip(row, prepared.is_zero_probability))
+            for row in signs
+        ]
+        return log_probabilities, magnitudes, uses_zero_probability
+
+    def _sums_numpy(self, potential_match_recs):
+        """As _sums, using a matrix of the signs of every potential match's terms"""
+        prepared = self.prepared_search_rec
+        num_recs = len(potential_match_recs)
+        potential_match_tkns = [
+            rec.tokenised_including_mispellings for rec in potential_match_recs
+        ]
+
+        signs = np.zeros((num_recs, len(prepared.weights)), dtype=np.int8)
+        for col, col_tokens in prepared.weighted_tokens.items():
+            if not col_tokens:
+                continue
+
+            # Encode the potential matches' tokens in this column as ids, and record which contain which
+            token_ids = {}
+            rows = []
+            ids = []
+            for row, rec_tkns in enumerate(potential_match_tkns):
+                for t in rec_tkns.get(col, []):
+                    rows.append(row)
+                    ids.append(token_ids.setdefault(t, len(token_ids)))
+            contains_token = np.zeros((num_recs, len(token_ids)), dtype=bool)
+            contains_token[rows, ids] = True
+
+            search_tokens = [t for t, position in col_tokens]
+            positions = [position for t, position in col_tokens]
+            misspellings = np.array(
+                [[is_misspelling(s, t) for t in token_ids] for s in search_tokens],
+                dtype=bool,
+            ).reshape(len(search_tokens), len(token_ids))
+
+            contains_misspelling = contains_token @ misspellings.T
+            contains = np.zeros((num_recs, len(search_tokens)), dtype=bool)
+            for i, s in enumerate(search_tokens):
+                if s in token_ids:
+                    contains[:, i] = contains_token[:, token_ids[s]]
+
+            signs[:, positions] = np.where(
+                contains, 1, np.where(contains_misspelling, 0, -1)
+            )
+
+        weights = np.array(prepared.weights, dtype=np.float64)
+        is_zero_probability = np.array(prepared.is_zero_probability, dtype=bool)
+        log_probabilities = signs @ weights
+        magnitudes = np.abs(signs) @ weights
+        uses_zero_probability = (signs != 0) @ is_zero_probability
+        return (
+            log_probabilities.tolist(),
+            magnitudes.tolist(),
+            uses_zero_probability.tolist(),
+        )
+
+    def scores(self, potential_match_recs):
+        """
+        Args:
+            potential_match_recs (list): The Records to score
+
+        Returns:
+            list: The score of each record
+        """
+        if not potential_match_recs:
+            return []
+
+        if np is None:
+            sums = self._sums(potential_match_recs)
+        else:
+            sums = self._sums_numpy(potential_match_recs)
+
+        scores = []
+        for rec, log_probability, magnitude, uses_zero_probability in zip(
+            potential_match_recs, *sums
+        ):
+            if magnitude > _MAX_LOG_PROBABILITY or uses_zero_probability:
+                scorer = RecordComparisonScorer(
+                    self.search_rec, rec, self.prepared_search_rec
+                )
+                scores.append(scorer.score)
+            else:
+                scores.append(log_probability / 30)
+        return scores
@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+
+from .utils import dict_factory
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def create_fts_vocab_table(conn):
+    """Create temp.fts_target_vocab, an fts5vocab table that gives the number of records whose concat_all
+    contains each token.  It's created per connection so it can be used with a read only database"""
+    try:
+        conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts_target_vocab
+            USING fts5vocab(main, fts_target, 'col')
+            """
+        )
+    except sqlite3.OperationalError:
+        logger.debug(
+            "fts5vocab is not available, so FTS query sizes will not be estimated"
+        )
+
+
+class ReadConnectionPool:
+    """
+    A pool of read only connections to a database file, which can be checked out by any thread.
+    This allows searches running in different threads to query the database at the same time
+    """
+
+    def __init__(
+        self,
+        db_filename: str,
+        max_connections: int = None,
+        mmap_size: int = 256 * 1024 * 1024,
+        timeout: float = None,
+    ):
+        """
+        Args:
+            db_filename (str): The filename of the database
+            max_connections (int, optional): The maximum number of connections open at once.  If all
+                connections are checked out, further requests wait for one to be returned.  Defaults to None,
+                meaning a new connection is opened whenever there is no idle connection.
+            mmap_size (int, optional): The number of bytes of the database file each connection may access
+                using memory-mapped I/O.  Defaults to 256MB.
+            timeout (float, optional): How many seconds to wait for a connection before raising a
+                queue.Empty exception.  Defaults to None, meaning wait indefinitely.
+        """
+        if db_filename == ":memory:":
+            raise ValueError(
+                "An in-memory database cannot be shared between connections"
+            )
+
+        self.uri = pathlib.Path(os.path.abspath(db_filename)).as_uri() + "?mode=ro"
+        self.max_connections = max_connections
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._closed = False
+
+    def _new_connection(self):
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        conn.row_factory = dict_factory
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        # Temporary tables can't be created once query_only is set
+        create_fts_vocab_table(conn)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _acquire(self):
+        if self._closed:
+            raise ValueError("The connection pool has been closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            limit = self.max_connections
+            if limit is None or len(self._connections) < limit:
+                conn = self._new_connection()
+                self._connections.append(conn)
+                logger.debug(f"Opened read connection {len(self._connections)}")
+                return conn
+
+        return self._idle.get(timeout=self.timeout)
+
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with block"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @property
+    def num_connections(self):
+        return len(self._connections)
+
+    def close(self):
+        """Close the connections.  Connections that are checked out are closed when they are returned"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._connections = []
@@ -1,9 +1,18 @@
-from collections import Counter
-from multiprocessing import Pool
+import asyncio
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import multiprocessing
 import json
 from functools import partial
+from itertools import chain, islice
+import os
+import pathlib
+import threading
 import uuid
+import time
 import warnings
+import weakref
 import copy
 
 
@@ -11,8 +20,11 @@ from datetime import datetime
 
 import sqlite3
 
-from .record import Record
-from .finder import MatchFinder
+from .record import Record, _MAX_SQL_PARAMETERS
+from .finder import FoundRecords, MatchFinder
+from .connections import ReadConnectionPool, create_fts_vocab_table
+from .cache import TokenProportionCache, fts_result_cache
+from .token_stats import open_token_stats, token_stats_path, write_token_stats
 from .utils import dict_factory
 
 import logging
@@ -30,6 +42,13 @@ class SearchDatabase:
         db_filename: str = None,
         cols_to_ignore: list = [],
         dmeta_cols: list = None,
+        processes: int = None,
+        start_method: str = None,
+        maxtasksperchild: int = None,
+        max_pending_batches: int = None,
+        max_pending_bytes: int = None,
+        read_only: bool = False,
+        max_read_connections: int = None,
     ):
         """
         Args:
@@ -40,17 +59,40 @@ class SearchDatabase:
             dmeta_cols (list, optional): If provided, only these named columns will be used to generate
                 dmetaphone token variants.  If None, all columns will be used.  If empty list, no columns
                 will be used
+            processes (int, optional): The number of worker processes used to process records when writing.
+                Defaults to the number of cpus.
+            start_method (str, optional): The multiprocessing start method for the worker processes, one of
+                'fork', 'spawn' or 'forkserver'.  Defaults to the platform default.
+            maxtasksperchild (int, optional): If provided, each worker process is replaced after processing
+                this many batches of records.  Defaults to None, meaning workers live as long as the pool.
+            max_pending_batches (int, optional): The maximum number of batches that may be in flight between
+                being read from the input and written to the database, which bounds memory use when writing.
+                Defaults to twice the number of worker processes.
+            max_pending_bytes (int, optional): If provided, additionally limit the batches in flight so that
+                their estimated processed size stays below this number of bytes.
+            read_only (bool, optional): Open an existing database file for searching only.  Nothing will be
+                written to the database, so many processes can search the same file at once.  Defaults to False.
+            max_read_connections (int, optional): The maximum number of read only connections used to serve
+                searches from different threads at the same time.  Defaults to None, meaning one connection is
+                opened for each concurrent search.
 
         """
 
         if not db_filename:
             db_filename = ":memory:"
         self.db_filename = db_filename
+        self.read_only = read_only
 
-        self.conn = sqlite3.connect(db_filename)
+        # Identifies this database's entries in the FTS result cache, see cache.py
+        if db_filename == ":memory:":
+            self.cache_namespace = f":memory:{uuid.uuid4().hex}"
+        else:
+            self.cache_namespace = os.path.abspath(db_filename)
 
-        # The connection will render query results as list of dicts
-        self.conn.row_factory = dict_factory
+        # Token proportions looked up by searches, see record.get_token_proportions
+        self.token_proportion_cache = TokenProportionCache()
+
+        self.conn = self._connect(db_filename, read_only)
 
         self.cols_to_ignore = cols_to_ignore
         self.dmeta_cols = dmeta_cols
@@ -64,6 +106,10 @@ class SearchDatabase:
             if dmeta_cols:
                 raise ValueError("You cannot set dmeta cols on an existing databsae")
 
+        elif read_only:
+            raise ValueError(
+                f"{db_filename} is not a fuzzyfinder database, so cannot be opened read only"
+            )
         else:
             self.initialise_db()
 
@@ -71,19 +117,140 @@ class SearchDatabase:
         self.example_record = None
         self.token_tables_empty = True
 
+        # See begin_bulk_load
+        bulk_loading = self.get_value_from_db_state_table("bulk_load_in_progress")
+        self.bulk_loading = bulk_loading == "true"
+
         # If connected to a database that already has records
-        if not self._table_df_is_empty:
+        if not self._table_df_is_empty or self.bulk_loading:
             self.set_unique_id_col_from_db()
             self.set_example_record_from_db()
             self.set_cols_to_ignore_from_db()
             self.set_dmeta_cols_from_db()
+            # A bulk load may have been started without any records having been written yet
+            if not read_only and self.example_record is not None:
+                self.migrate_token_tables()
             self.check_col_counters()
+            self.check_bulk_load()
 
         # If the user is adding multiple talbes (e.g. calling write_pandas_dataframe several times)
         # it's more performant to retain column counters across these tables and write them once
         # rather than writing after each table
         self.column_counters = None
 
+        # The worker pool is created on first write and then reused, so that repeated writes don't pay
+        # to start new processes, and the workers' tokenisation caches stay warm
+        self.processes = processes or os.cpu_count() or 1
+        self.start_method = start_method
+        self.maxtasksperchild = maxtasksperchild
+        self._pool = None
+        self._pool_finalizer = None
+        self._worker_barrier = None
+
+        # Searches check out a connection from this pool, so that searches in different threads can run
+        # at the same time.  It is created on first search, see read_connection
+        self.max_read_connections = max_read_connections
+        self._read_pool = None
+        self._read_pool_lock = threading.Lock()
+        self._search_executor = None
+
+        # Memory-mapped snapshots of the token proportions written by build_or_replace_stats_tables,
+        # see token_stats
+        self._token_stats = {}
+        self._token_stats_version = None
+        self._token_stats_lock = threading.Lock()
+
+        self.max_pending_batches = max_pending_batches or 2 * self.processes
+        self.max_pending_bytes = max_pending_bytes
+
+        # Timings and sizes from the most recent write, see _write_batches_parallel
+        # and write_all_col_counters_to_db
+        self.last_write_stats = None
+        self.last_col_counters_write_stats = None
+
+    @staticmethod
+    def _connect(db_filename, read_only):
+        if read_only:
+            if db_filename == ":memory:":
+                raise ValueError("An in-memory database cannot be opened read only")
+            uri = pathlib.Path(os.path.abspath(db_filename)).as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True)
+        else:
+            # Async searches of an in-memory database use this connection from a worker thread
+            conn = sqlite3.connect(db_filename, check_same_thread=False)
+
+        # The connection will render query results as list of dicts
+        conn.row_factory = dict_factory
+        create_fts_vocab_table(conn)
+        return conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def pool(self):
+        """The pool of worker processes used to process records when writing"""
+        if self._pool is None:
+            context = multiprocessing.get_context(self.start_method)
+            # Used to make sure each worker hands over its token counts at the end of a write, see
+            # WorkerColumnCounters
+            self._worker_barrier = context.Barrier(self.processes)
+            self._pool = context.Pool(
+                processes=self.processes,
+                maxtasksperchild=self.maxtasksperchild,
+                initializer=_init_write_worker,
+                initargs=(self._worker_barrier,),
+            )
+            # Make sure the worker processes are shut down if the database is garbage collected
+            # without being closed
+            self._pool_finalizer = weakref.finalize(self, self._pool.terminate)
+        return self._pool
+
+    def close_pool(self):
+        """Shut down the worker processes.  A new pool will be started if more records are written"""
+        if self._pool is not None:
+            self._pool_finalizer.detach()
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._pool_finalizer = None
+            self._worker_barrier = None
+
+    @contextmanager
+    def read_connection(self):
+        """Check out a read only connection for searching.  An in-memory database cannot be shared between
+        connections, so searches of an in-memory database all use self.conn"""
+        if self.db_filename == ":memory:":
+            yield self.conn
+            return
+
+        if self._read_pool is None:
+            with self._read_pool_lock:
+                if self._read_pool is None:
+                    self._read_pool = ReadConnectionPool(
+                        self.db_filename, max_connections=self.max_read_connections
+                    )
+        with self._read_pool.connection() as conn:
+            yield conn
+
+    def close(self):
+        """Shut down the worker processes and close the database connections"""
+        self.close_pool()
+        if self._search_executor is not None:
+            self._search_executor.shutdown()
+            self._search_executor = None
+        if self._read_pool is not None:
+            self._read_pool.close()
+            self._read_pool = None
+        for stats in self._token_stats.values():
+            stats.close()
+        self._token_stats = {}
+        self._token_stats_version = None
+        self.conn.close()
+
     @property
     def _table_df_exists(self):
         c = self.conn.cursor()
@@ -144,6 +311,7 @@ class SearchDatabase:
             "cols_to_ignore", json.dumps(self.cols_to_ignore)
         )
         self.set_key_value_to_db_state_table("dmeta_cols", json.dumps(self.dmeta_cols))
+        self.set_key_value_to_db_state_table("bulk_load_in_progress", "false")
 
         # Create FTS table
         sql = """
@@ -176,14 +344,17 @@ class SearchDatabase:
         c.close()
         self.conn.commit()
 
-    def get_value_from_db_state_table(self, key):
+    def get_value_from_db_state_table(self, key, default=None, conn=None):
 
         sql = """
             select * from db_state
             where key = ?
         """
-        c = self.conn.execute(sql, (key,))
+        c = (conn or self.conn).execute(sql, (key,))
         results = c.fetchall()
+        if not results:
+            # e.g. a key added in a later version of fuzzyfinder than the one that created the database
+            return default
         return results[0]["value"]
 
     def check_col_counters(self):
@@ -193,19 +364,87 @@ class SearchDatabase:
                 "Your token counters are out of sync with the database, rebuild recommended."
             )
 
+    def check_bulk_load(self):
+        if self.bulk_loading:
+            warnings.warn(
+                "A bulk load was started on this database but not finished.  "
+                "Call finish_bulk_load() before searching."
+            )
+
     def initialise_token_tables(self):
         rec = self.example_record
         columns = rec.columns_to_index
         c = self.conn.cursor()
 
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS token_count_totals
+            (column_name TEXT PRIMARY KEY, total_token_count int)
+            """
+        )
+
         for col in columns:
             sql = f"""
-                    CREATE TABLE {col}_token_counts
-                    (token text PRIMARY KEY, token_count int, token_proportion float)
+                    CREATE TABLE {col}_token_count_values
+                    (token text PRIMARY KEY, token_count int)
                    """
             c.execute(sql)
+            self._create_token_counts_view(c, col)
+            c.execute("INSERT INTO token_count_totals VALUES (?, 0)", (col,))
+
+        c.close()
+        self.conn.commit()
+
+    @staticmethod
+    def _create_token_counts_view(c, col):
+        # Token proportions are derived from the running total for the column when they're read, so adding
+        # records never requires every token's proportion to be rewritten
+        sql = f"""
+                CREATE VIEW {col}_token_counts AS
+                SELECT
+                    token,
+                    token_count,
+                    cast(token_count as float) / (
+                        SELECT total_token_count
+                        FROM token_count_totals
+                        WHERE column_name = '{col}'
+                    ) as token_proportion
+                FROM {col}_token_count_values
+               """
+        c.execute(sql)
 
+    def migrate_token_tables(self):
+        """Databases created by earlier versions of fuzzyfinder stored token proportions in a table called
+        {col}_token_counts.  Convert these to the current layout"""
+        c = self.conn.cursor()
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS token_count_totals
+            (column_name TEXT PRIMARY KEY, total_token_count int)
+            """
+        )
+        for col in self.example_record.columns_to_index:
+            c.execute(
+                "SELECT type FROM sqlite_master WHERE name = ?",
+                (f"{col}_token_counts",),
+            )
+            result = c.fetchone()
+            if result is None or result["type"] != "table":
+                continue
+            logger.info(f"Migrating {col}_token_counts to a view")
+            c.execute(
+                f"ALTER TABLE {col}_token_counts RENAME TO {col}_token_count_values"
+            )
+            self._create_token_counts_view(c, col)
+            c.execute(
+                f"""
+                INSERT OR REPLACE INTO token_count_totals
+                SELECT '{col}', coalesce(sum(token_count), 0)
+                FROM {col}_token_count_values
+                """
+            )
         c.close()
+        self.conn.commit()
 
     @staticmethod
     def _record_dict_to_insert_data(
@@ -232,13 +471,7 @@ class SearchDatabase:
         )
         uid = record.id
 
-        def convert(o):
-            if "NA" in repr(type(o)):
-                return None
-            else:
-                return int(o)
-
-        jsond = json.dumps(record.record_dict, default=convert)
+        jsond = json.dumps(record.record_dict, default=_json_default)
 
         concat = record.tokenised_stringified_with_misspellings
 
@@ -266,11 +499,28 @@ class SearchDatabase:
         Returns:
             dict: A dict containing 'result_tuples', a list of tuples ready to insert into the table df and
                   'column_counters' a dict of Counters(), one for each column, containing aggregated token counts
-                  'record_dicts' the original record dictionaries.  Needed in case the batch fails database integrity
-                  constraints and records need to be added one by one.
+                  'token_lengths' a tuple per record of the number of tokens from each column in its concat_all.
+                  Needed to work out the token counts of records that are not inserted because their unique id
+                  already exists.
+                  'original_dicts' the original record dictionaries.  Only needed, and only provided, when the
+                  records do not all have the same columns, in which case token_lengths is None.
         """
+        # Where every record has the same columns (e.g. they came from a dataframe), tokenise a column
+        # at a time rather than a record at a time
+        first_keys = list(record_dicts[0].keys())
+        if all(list(rd.keys()) == first_keys for rd in record_dicts):
+            columns = {col: [rd[col] for rd in record_dicts] for col in first_keys}
+            results_batch = SearchDatabase._column_batch_to_insert_data(
+                columns,
+                unique_id_col=unique_id_col,
+                cols_to_ignore=cols_to_ignore,
+                dmeta_cols=dmeta_cols,
+            )
+            return results_batch
+
         results_batch = {
             "result_tuples": [],
+            "token_lengths": None,
             "column_counters": ColumnCounters(
                 Record(
                     record_dicts[0],
@@ -296,64 +546,259 @@ class SearchDatabase:
 
         return results_batch
 
-    def bulk_insert_batch(self, results_batch, column_counters):
+    @staticmethod
+    def _column_batch_to_insert_data(
+        columns: dict, unique_id_col: str, cols_to_ignore: list, dmeta_cols
+    ):
+        """Process a batch of records held column-wise into data ready to be entered into the database.
+
+        This produces exactly the same rows and token counts as _record_batch_to_insert_data, but tokenises
+        a column at a time and never builds a Record per row.
+
+        Args:
+            columns (dict): A dict of column name to list of values, e.g. from pyarrow's RecordBatch.to_pydict()
+
+        Returns:
+            dict: The same structure as _record_batch_to_insert_data
+        """
+        col_names = list(columns.keys())
+        example_record = Record(
+            {c: columns[c][0] for c in col_names},
+            unique_id_col=unique_id_col,
+            cols_to_ignore=cols_to_ignore,
+            dmeta_cols=dmeta_cols,
+        )
+        column_counters = ColumnCounters(example_record)
+
+        tokens_by_column = []
+        # Same order as the columns in column_counters
+        for col in example_record.columns_to_index:
+            col_tokens = Record.tokenise_column(columns[col])
+            if dmeta_cols is None or col in dmeta_cols:
+                col_tokens = [
+                    tokens + Record.tokens_to_misspelling_tokens(tokens)
+                    for tokens in col_tokens
+                ]
+            column_counters.update_single_column(col, chain.from_iterable(col_tokens))
+            tokens_by_column.append(col_tokens)
+
+        concats = [
+            " ".join(chain.from_iterable(row_tokens))
+            for row_tokens in zip(*tokens_by_column)
+        ]
+
+        jsons = [
+            json.dumps(dict(zip(col_names, row)), default=_json_default)
+            for row in zip(*columns.values())
+        ]
+
+        result_tuples = list(zip(columns[unique_id_col], jsons, concats))
+
+        token_lengths = list(
+            zip(*[[len(t) for t in col_tokens] for col_tokens in tokens_by_column])
+        )
+
+        return {
+            "result_tuples": result_tuples,
+            "column_counters": column_counters,
+            "token_lengths": token_lengths,
+            "original_dicts": None,
+        }
+
+    @staticmethod
+    def _arrow_batch_to_insert_data(
+        record_batch, unique_id_col: str, cols_to_ignore: list, dmeta_cols
+    ):
+        """Process a pyarrow RecordBatch into data ready to be entered into the database.  Runs in a worker,
+        so that the batch's values are only converted to python objects there
+
+        Returns:
+            dict: The same structure as _record_batch_to_insert_data
+        """
+        return SearchDatabase._column_batch_to_insert_data(
+            record_batch.to_pydict(),
+            unique_id_col=unique_id_col,
+            cols_to_ignore=cols_to_ignore,
+            dmeta_cols=dmeta_cols,
+        )
+
+    def bulk_insert_batch(self, results_batch, token_counts):
+        """Insert a processed batch of records.  The token counts of records that aren't inserted because their
+        unique id is already in the database are passed to token_counts.skip()"""
 
         # See here: https://stackoverflow.com/questions/52912010
         result_tuples = results_batch["result_tuples"]
 
         c = self.conn.cursor()
 
-        try:
-            c.executemany("INSERT INTO df VALUES (?, ?, ?)", result_tuples)
-        except sqlite3.IntegrityError:
-            c.execute("rollback")
+        if self.bulk_loading:
+            # Neither the primary key nor the FTS index are maintained during a bulk load.  Both are built,
+            # and duplicates dealt with, in finish_bulk_load
+            c.executemany("INSERT INTO df_bulk_load VALUES (?, ?, ?)", result_tuples)
             c.close()
-            raise sqlite3.IntegrityError()
+            self.conn.commit()
+            return
 
-        # This will have errored out and rolled back already if there was an integrity error
-        # i.e. these lines will not be hit
+        # Most batches contain only new unique ids, and can be inserted directly
+        if not self._batch_may_overlap(c, result_tuples):
+            try:
+                c.executemany("INSERT INTO df VALUES (?, ?, ?)", result_tuples)
+                c.executemany(
+                    "INSERT INTO fts_target VALUES (?, ?)",
+                    ((t[0], t[2]) for t in result_tuples),
+                )
+            except sqlite3.IntegrityError:
+                # Unique ids that only sqlite sees as the same, e.g. 1 and "1".  Fall back to staging the batch
+                self.conn.rollback()
+            else:
+                c.close()
+                self.conn.commit()
+                fts_result_cache.invalidate(self.cache_namespace)
+                return
 
-        # Insert FTS entries
-        result_tuples = [(t[0], t[2]) for t in result_tuples]
+        self._insert_new_records_from_batch(c, results_batch, token_counts)
 
-        sql = """
-        INSERT INTO fts_target
-        VALUES (?, ?)
-        """
-        c.executemany(sql, result_tuples)
+    def _batch_may_overlap(self, c, result_tuples):
+        """Whether any unique id in result_tuples appears more than once, or is already in the database"""
+        ids = [t[0] for t in result_tuples]
+        if len(set(ids)) < len(ids):
+            return True
+        for start in range(0, len(ids), _MAX_SQL_PARAMETERS):
+            chunk = ids[start : start + _MAX_SQL_PARAMETERS]
+            placeholders = ", ".join("?" * len(chunk))
+            c.execute(
+                f"SELECT 1 FROM df WHERE unique_id IN ({placeholders}) LIMIT 1", chunk
+            )
+            if c.fetchone() is not None:
+                return True
+        return False
+
+    def _insert_new_records_from_batch(self, c, results_batch, token_counts):
+        """Insert the records in results_batch whose unique ids are not already in the database, keeping the first
+        record where a unique id appears more than once in the batch"""
+        result_tuples = results_batch["result_tuples"]
+
+        # Stage the batch, then insert the first record for each unique_id that is not already in the database.
+        # This means a batch that overlaps with existing records is dealt with in a few set-based statements
+        c.execute("DROP TABLE IF EXISTS temp.df_staging")
+        c.execute("DROP TABLE IF EXISTS temp.df_staging_new")
+        c.execute(
+            """
+            CREATE TEMP TABLE df_staging
+                (batch_position INTEGER PRIMARY KEY,
+                 unique_id,
+                 original_record JSON,
+                 concat_all TEXT)
+            """
+        )
+        c.executemany(
+            "INSERT INTO temp.df_staging VALUES (?, ?, ?, ?)",
+            ((i, *t) for i, t in enumerate(result_tuples)),
+        )
+
+        # df.unique_id is TEXT, so compare using the text value of the staged unique_id
+        c.execute(
+            """
+            SELECT first_position
+            FROM (
+                SELECT min(batch_position) as first_position, cast(unique_id as TEXT) as uid_text
+                FROM temp.df_staging
+                GROUP BY uid_text
+            ) as g
+            WHERE NOT EXISTS (SELECT 1 FROM df WHERE df.unique_id = g.uid_text)
+            ORDER BY first_position
+            """
+        )
+        new_positions = [r["first_position"] for r in c.fetchall()]
+
+        if len(new_positions) == len(result_tuples):
+            new_rows = "1 = 1"
+        else:
+            c.execute(
+                "CREATE TEMP TABLE df_staging_new (batch_position INTEGER PRIMARY KEY)"
+            )
+            c.executemany(
+                "INSERT INTO temp.df_staging_new VALUES (?)",
+                ((p,) for p in new_positions),
+            )
+            new_rows = (
+                "batch_position IN (SELECT batch_position FROM temp.df_staging_new)"
+            )
+
+        c.execute(
+            f"""
+            INSERT INTO df
+            SELECT unique_id, original_record, concat_all
+            FROM temp.df_staging
+            WHERE {new_rows}
+            ORDER BY batch_position
+            """
+        )
+        c.execute(
+            f"""
+            INSERT INTO fts_target
+            SELECT unique_id, concat_all
+            FROM temp.df_staging
+            WHERE {new_rows}
+            ORDER BY batch_position
+            """
+        )
+
+        c.execute("DROP TABLE temp.df_staging")
+        c.execute("DROP TABLE IF EXISTS temp.df_staging_new")
         c.close()
         self.conn.commit()
+        if new_positions:
+            fts_result_cache.invalidate(self.cache_namespace)
+
+        num_skipped = len(result_tuples) - len(new_positions)
+        if num_skipped:
+            logger.debug(f"{num_skipped} records already exist in db, ignoring")
+
+            # Note counts are only corrected if the whole transaction completes successfully
+            skipped_positions = sorted(
+                set(range(len(result_tuples))).difference(new_positions)
+            )
+            token_counts.skip(
+                self._column_counters_for_positions(results_batch, skipped_positions)
+            )
 
-        # Passed by reference so can mutate object
-        # Note counters only updated if whole transaction completes successfully
-        new_column_counters = results_batch["column_counters"]
+    def _column_counters_for_positions(self, results_batch, positions):
+        """Token counts for the records in results_batch at the given positions, worked out from the stored
+        tokens of each record, without re-tokenising"""
 
-        column_counters.update(new_column_counters)
+        result_tuples = results_batch["result_tuples"]
+        token_lengths = results_batch["token_lengths"]
 
-    def insert_batch_one_by_one(self, batch, column_counters):
-        # If bulk insert failed, we want to insert records one by one
-        # logging integrity errors
-        # Where integrity checks fail, we do not want to increment counters
-        c = self.conn.cursor()
-        for record_dict in batch:
+        def retokenise(record_dict):
             insert_data = self._record_dict_to_insert_data(
-                record_dict, unique_id_col=self.unique_id_col
+                record_dict,
+                unique_id_col=self.unique_id_col,
+                cols_to_ignore=self.cols_to_ignore,
+                dmeta_cols=self.dmeta_cols,
             )
-            insert_tuple = insert_data["df_tuple"]
-            try:
-                c.execute("INSERT INTO df VALUES (?, ?, ?)", insert_tuple)
-                fts_tuple = (insert_tuple[0], insert_tuple[2])
-                c.execute("INSERT INTO fts_target VALUES (?, ?)", fts_tuple)
-            except sqlite3.IntegrityError:
-                logger.debug(
-                    f"Record id {insert_tuple[0]} already exists in db, ignoring"
-                )
-                continue
+            column_counters.update(insert_data["column_counters"])
 
-            new_column_counters = insert_data["column_counters"]
-            column_counters.update(new_column_counters)
-        c.close()
-        self.conn.commit()
+        column_counters = ColumnCounters(self.example_record)
+
+        if token_lengths is None:
+            # The records in this batch did not all have the same columns, so re-tokenise them
+            for p in positions:
+                retokenise(results_batch["original_dicts"][p])
+            return column_counters
+
+        columns = results_batch["columns"]
+        for p in positions:
+            row_tokens = _split_concat_by_column(
+                result_tuples[p][2], columns, token_lengths[p]
+            )
+            if row_tokens is None:
+                # A token contains a space (e.g. some double metaphone codes), so re-tokenise the record
+                retokenise(json.loads(result_tuples[p][1]))
+                continue
+            for col, tokens in row_tokens:
+                column_counters.update_single_column(col, tokens)
+        return column_counters
 
     def write_list_dicts_parallel(
         self,
@@ -370,6 +815,50 @@ class SearchDatabase:
             batch_size (int, optional): How many records to send to each parallel worker. Defaults to 10000.
         """
 
+        self.write_records_iterable(
+            list_dicts,
+            unique_id_col=unique_id_col,
+            batch_size=batch_size,
+            write_column_counters=write_column_counters,
+        )
+
+    def write_records_iterable(
+        self,
+        records,
+        unique_id_col: str,
+        batch_size=10_000,
+        write_column_counters=True,
+    ):
+        """Stream records from any iterable (a list, a generator, a database cursor etc.) into the database.
+
+        Records are pulled from the iterable lazily, one batch at a time, and only a small, fixed number of
+        batches are in flight at any time, so memory use does not grow with the size of the input.
+
+        Args:
+            records (iterable): An iterable of dictionaries, each one representing a record
+            unique_id_col (str): The column that contains the unique record identifier
+            batch_size (int, optional): How many records to send to each parallel worker. Defaults to 10000.
+            write_column_counters (bool, optional): Whether to write token counts to the database once all
+                records have been processed.  Defaults to True.
+        """
+
+        records = iter(records)
+        first_record = next(records, None)
+        if first_record is None:
+            logger.debug("No records to write")
+            return
+
+        self._setup_from_first_record(first_record, unique_id_col)
+
+        batches_of_records = chunk_iterable(chain([first_record], records), batch_size)
+
+        self._write_batches_parallel(
+            batches_of_records,
+            self._record_batch_to_insert_data,
+            write_column_counters=write_column_counters,
+        )
+
+    def _setup_from_first_record(self, record_dict, unique_id_col):
         # This may be the first time we've seen a record.  If so, need to do some setup
         if self.unique_id_col is None:
             self.unique_id_col = unique_id_col
@@ -377,7 +866,7 @@ class SearchDatabase:
 
         if self.example_record is None:
             record = Record(
-                list_dicts[0],
+                record_dict,
                 unique_id_col=self.unique_id_col,
                 cols_to_ignore=self.cols_to_ignore,
                 dmeta_cols=self.dmeta_cols,
@@ -385,41 +874,81 @@ class SearchDatabase:
             self.example_record = record
             self.initialise_token_tables()
 
-        batches_of_records = chunk_list(list_dicts, batch_size)
+    def _write_batches_parallel(
+        self, batches, batch_to_insert_data, write_column_counters=True
+    ):
+        """Process batches in parallel using batch_to_insert_data, writing the results to the database
+        as they arrive"""
 
         ##########################
         # Start of parallelisation
         ##########################
-        p = Pool()
+        p = self.pool
+        token_counts = WorkerColumnCounters(
+            p, self.processes, self._worker_barrier, self.example_record
+        )
         fn = partial(
-            self._record_batch_to_insert_data,
+            _batch_to_insert_data_in_worker,
+            batch_to_insert_data=batch_to_insert_data,
+            write_id=token_counts.write_id,
+            maxtasksperchild=self.maxtasksperchild,
             unique_id_col=self.unique_id_col,
             cols_to_ignore=self.cols_to_ignore,
             dmeta_cols=self.dmeta_cols,
         )
-        results_batches = p.imap_unordered(fn, batches_of_records)
 
         if self.column_counters is None:
             self.column_counters = ColumnCounters(self.example_record)
 
-        # Since it's an imap, which results in a generator
-        # This starts executing as soon as the first batch completes.
-        # So these writes don't need parallising (it's much faster to run the insert than to process the batch)
-        # Meaning we can just do them slowly while we're waiting for batches to compute
+        # Batches are submitted to the pool lazily, and the number of batches that are either being processed
+        # or waiting to be written is capped.  This means we never pull more than a few batches from the
+        # input iterable ahead of the writer, so memory stays flat however large the input is.
+        # It's much faster to run the insert than to process the batch, so the writes can happen on this
+        # thread while we're waiting for the workers.
         # There's a gist here which demonstrates the principle:
         # https://gist.github.com/RobinL/4e6a266f0287df32f2aa7aee1b3a5450
-        for results_batch in results_batches:
-            # If an insert fails it's because one of the unique_ids already exists
-            # If so, insert the records one by one, logging integrity errors
-            try:
-                self.bulk_insert_batch(results_batch, self.column_counters)
-            except sqlite3.IntegrityError:
-                self.insert_batch_one_by_one(
-                    results_batch["original_dicts"], self.column_counters
+        stats = {
+            "batches_written": 0,
+            "records_written": 0,
+            "bytes_written": 0,
+            "peak_pending_batches": 0,
+            # Time the writer spent blocked waiting for workers to finish a batch
+            "writer_wait_seconds": 0.0,
+            # Time finished batches spent waiting for the writer to get round to them
+            "producer_wait_seconds": 0.0,
+        }
+        completed_at = {}
+        pending = deque()
+        for batch_number, batch in enumerate(batches):
+            callback = partial(_record_completion_time, completed_at, batch_number)
+            async_result = p.apply_async(fn, (batch,), callback=callback)
+            pending.append((batch_number, async_result))
+            stats["peak_pending_batches"] = max(
+                stats["peak_pending_batches"], len(pending)
+            )
+            while len(pending) >= self._pending_batches_limit(stats):
+                self._write_next_pending_batch(
+                    pending, completed_at, stats, token_counts
                 )
 
-        p.close()
-        p.join()
+        while pending:
+            self._write_next_pending_batch(pending, completed_at, stats, token_counts)
+
+        # The workers have been adding up the token counts of the batches they processed, so only a few
+        # large counters, one per worker, are merged into self.column_counters
+        start_time = time.perf_counter()
+        write_counters = token_counts.result()
+        if write_counters is not None:
+            self.column_counters.update(write_counters)
+        stats["counter_collect_seconds"] = time.perf_counter() - start_time
+        stats["column_counters_received"] = token_counts.num_received
+
+        self.last_write_stats = stats
+        logger.info(
+            f"Wrote {stats['records_written']} records in {stats['batches_written']} batches. "
+            f"Writer waited {stats['writer_wait_seconds']:.2f}s for workers, "
+            f"finished batches waited {stats['producer_wait_seconds']:.2f}s for the writer"
+        )
 
         self.set_key_value_to_db_state_table("col_counters_in_sync", "false")
 
@@ -430,62 +959,162 @@ class SearchDatabase:
         if write_column_counters:
             self.write_all_col_counters_to_db()
 
+    def _pending_batches_limit(self, stats):
+        limit = self.max_pending_batches
+        # Use the size of the batches written so far to estimate how many fit within max_pending_bytes.
+        # Until the first batch has been written we have no estimate, so only allow one in flight
+        if self.max_pending_bytes:
+            if stats["batches_written"] == 0:
+                return 1
+            bytes_per_batch = stats["bytes_written"] / stats["batches_written"]
+            limit = min(limit, int(self.max_pending_bytes // bytes_per_batch))
+        return max(limit, 1)
+
+    def _write_next_pending_batch(self, pending, completed_at, stats, token_counts):
+        batch_number, async_result = pending.popleft()
+
+        start_time = time.perf_counter()
+        results_batch = async_result.get()
+        picked_up_at = time.perf_counter()
+
+        stats["writer_wait_seconds"] += picked_up_at - start_time
+        stats["producer_wait_seconds"] += picked_up_at - completed_at.pop(
+            batch_number, picked_up_at
+        )
+
+        stats["batches_written"] += 1
+        stats["records_written"] += len(results_batch["result_tuples"])
+        stats["bytes_written"] += _results_batch_size(results_batch)
+
+        token_counts.add_results_batch(results_batch)
+        self.bulk_insert_batch(results_batch, token_counts)
+
     def write_all_col_counters_to_db(self):
 
         logger.info("starting to write all col counters")
 
+        self._invalidate_token_stats()
         columns = self.column_counters.columns
         c = self.conn.cursor()
+
+        total_tokens = 0
+        start_time = datetime.now()
         for col in columns:
             counter = self.column_counters[col]
 
-            start_time = datetime.now()
-
-            try:
-                # This is slightly faster, but requires a relative new version of sqlite
-                for token, value in counter.items():
-
-                    sql = f"""
-                        INSERT INTO {col}_token_counts VALUES (?, ?, ?)
-                        ON CONFLICT(token) DO UPDATE SET
-                        token_count = token_count + ?
-                        WHERE token = ?;
-                    """
-
-                    c.execute(sql, (token, value, None, value, token))
-            except sqlite3.OperationalError:
-                # Older versions of sqlite that do not support upsert
-
-                for token, value in counter.items():
-
-                    sql = f"""
-                        INSERT OR IGNORE INTO {col}_token_counts VALUES (?, ?, ?)
-                    """
-                    c.execute(sql, (token, 0, None))
+            col_start_time = datetime.now()
 
-                    sql = f"""
-                    UPDATE {col}_token_counts SET token_count = token_count + {value}
-                        WHERE token = '{token}';
-                    """
-                    c.execute(sql)
+            self._merge_counter_into_token_counts(c, col, counter)
 
-            duration = datetime.now() - start_time
-            logger.debug(f"Writing column counters for {col} took {duration}")
+            duration = datetime.now() - col_start_time
+            logger.debug(
+                f"Writing column counters for {col} took {duration} "
+                f"({_per_second(len(counter), duration):,.0f} tokens/sec)"
+            )
+            total_tokens += len(counter)
 
+        c.execute("DROP TABLE IF EXISTS temp.token_counts_staging")
         c.close()
         self.conn.commit()
 
+        duration = datetime.now() - start_time
+        self.last_col_counters_write_stats = {
+            "tokens_written": total_tokens,
+            "seconds": duration.total_seconds(),
+            "tokens_per_second": _per_second(total_tokens, duration),
+        }
+        logger.info(
+            f"Wrote {total_tokens:,} distinct tokens in {duration} "
+            f"({self.last_col_counters_write_stats['tokens_per_second']:,.0f} tokens/sec)"
+        )
+
         self.set_key_value_to_db_state_table("col_counters_in_sync", "true")
 
         # reset column counters
         self.column_counters = None
 
+    @staticmethod
+    def _upsert_staged_token_counts(c, col):
+        """Merge temp.token_counts_staging into {col}_token_count_values with a single upsert, which requires a
+        version of sqlite that supports upsert (3.24+)"""
+        # The WHERE true is needed to avoid a parsing ambiguity, see https://sqlite.org/lang_upsert.html
+        # Merging in token order means the primary key index is updated sequentially
+        sql = f"""
+            INSERT INTO {col}_token_count_values (token, token_count)
+            SELECT token, token_count
+            FROM temp.token_counts_staging
+            WHERE true
+            ORDER BY token
+            ON CONFLICT(token) DO UPDATE SET
+            token_count = token_count + excluded.token_count
+        """
+        c.execute(sql)
+
+    @staticmethod
+    def _merge_counter_into_token_counts(c, col, counter):
+        """Add the counts in counter to the table {col}_token_count_values, using a single set-based statement
+        rather than one statement per token, and keep the column's total up to date"""
+
+        # Stage the counts in a temporary table with a single executemany
+        c.execute("DROP TABLE IF EXISTS temp.token_counts_staging")
+        c.execute(
+            """
+            CREATE TEMP TABLE token_counts_staging
+            (token text, token_count int)
+            """
+        )
+        c.executemany(
+            "INSERT INTO temp.token_counts_staging VALUES (?, ?)", counter.items()
+        )
+
+        try:
+            SearchDatabase._upsert_staged_token_counts(c, col)
+        except sqlite3.OperationalError as e:
+            # Older versions of sqlite that do not support upsert fail to parse it.  Anything else is a real error
+            if "syntax error" not in str(e):
+                raise
+            # Update the tokens we've seen before, then insert the new ones
+            c.execute(
+                "CREATE INDEX temp.token_counts_staging_token ON token_counts_staging(token)"
+            )
+            sql = f"""
+                UPDATE {col}_token_count_values
+                SET token_count = token_count + (
+                    SELECT s.token_count
+                    FROM temp.token_counts_staging as s
+                    WHERE s.token = {col}_token_count_values.token
+                )
+                WHERE token IN (SELECT token FROM temp.token_counts_staging)
+            """
+            c.execute(sql)
+
+            sql = f"""
+                INSERT INTO {col}_token_count_values (token, token_count)
+                SELECT token, token_count
+                FROM temp.token_counts_staging
+                WHERE token NOT IN (SELECT token FROM {col}_token_count_values)
+            """
+            c.execute(sql)
+
+        c.execute(
+            """
+            UPDATE token_count_totals
+            SET total_token_count = total_token_count + ?
+            WHERE column_name = ?
+            """,
+            (sum(counter.values()), col),
+        )
+
     def set_example_record_from_db(self):
         c = self.conn.cursor()
 
-        c.execute("select original_record from df limit 1")
+        table = "df_bulk_load" if self.bulk_loading else "df"
+        c.execute(f"select original_record from {table} limit 1")
         record = c.fetchone()
         c.close()
+        if record is None:
+            # A bulk load with no records written yet.  The example record is set by the first write
+            return
         record = record["original_record"]
         record = json.loads(record)
         self.example_record = Record(
@@ -516,89 +1145,754 @@ class SearchDatabase:
         write_column_counters=True,
     ):
 
-        records_as_dict = pd_df.to_dict(orient="records")
+        self.write_records_iterable(
+            pandas_dataframe_to_records(pd_df, batch_size),
+            unique_id_col=unique_id_col,
+            batch_size=batch_size,
+            write_column_counters=write_column_counters,
+        )
 
-        self.write_list_dicts_parallel(
-            records_as_dict,
+    def write_pandas_dataframe_chunks(
+        self,
+        pd_df_chunks,
+        unique_id_col: str,
+        batch_size: int = 10_000,
+        write_column_counters=True,
+    ):
+        """Write an iterable of pandas dataframes to the database, e.g. the reader returned by
+        pd.read_csv(..., chunksize=n).  Only a few chunks are held in memory at any one time.
+
+        Args:
+            pd_df_chunks (iterable): An iterable of pandas dataframes with the same columns
+            unique_id_col (str): The column that contains the unique record identifier
+            batch_size (int, optional): How many records to send to each parallel worker. Defaults to 10000.
+            write_column_counters (bool, optional): Whether to write token counts to the database once all
+                records have been processed.  Defaults to True.
+        """
+
+        records = (
+            record
+            for pd_df in pd_df_chunks
+            for record in pandas_dataframe_to_records(pd_df, batch_size)
+        )
+
+        self.write_records_iterable(
+            records,
             unique_id_col=unique_id_col,
             batch_size=batch_size,
             write_column_counters=write_column_counters,
         )
 
-    def _update_token_stats_tables(self):
-        rec = self.example_record
-        columns = rec.columns_to_index
+    def write_arrow_table(
+        self,
+        table,
+        unique_id_col: str,
+        batch_size: int = 10_000,
+        write_column_counters=True,
+    ):
+        """Write a pyarrow Table to the database.  Records are tokenised a column at a time straight from the
+        Arrow record batches, which is much faster than converting each row into a dict first.
+
+        Args:
+            table (pyarrow.Table): The table of records to write
+            unique_id_col (str): The column that contains the unique record identifier
+            batch_size (int, optional): How many records to send to each parallel worker. Defaults to 10000.
+            write_column_counters (bool, optional): Whether to write token counts to the database once all
+                records have been processed.  Defaults to True.
+        """
+
+        self.write_arrow_record_batches(
+            table.to_batches(max_chunksize=batch_size),
+            unique_id_col=unique_id_col,
+            write_column_counters=write_column_counters,
+        )
+
+    def write_parquet(
+        self,
+        path: str,
+        unique_id_col: str,
+        batch_size: int = 10_000,
+        columns: list = None,
+        write_column_counters=True,
+    ):
+        """Stream a parquet file into the database using pyarrow.  The file is read a row group at a time, and
+        each row group is sent to the workers in batches of at most batch_size rows.
+
+        Args:
+            path (str): Path to the parquet file
+            unique_id_col (str): The column that contains the unique record identifier
+            batch_size (int, optional): How many records to send to each parallel worker. Defaults to 10000.
+            columns (list, optional): If provided, only read these columns from the file
+            write_column_counters (bool, optional): Whether to write token counts to the database once all
+                records have been processed.  Defaults to True.
+        """
+
+        try:
+            import pyarrow.parquet as pq
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "You've asked to write a parquet file but pyarrow is not installed"
+            )
+
+        parquet_file = pq.ParquetFile(path)
+        record_batches = (
+            record_batch
+            for i in range(parquet_file.num_row_groups)
+            for record_batch in parquet_file.read_row_group(
+                i, columns=columns
+            ).to_batches(max_chunksize=batch_size)
+        )
+        self.write_arrow_record_batches(
+            record_batches,
+            unique_id_col=unique_id_col,
+            write_column_counters=write_column_counters,
+        )
+
+    def write_arrow_record_batches(
+        self,
+        record_batches,
+        unique_id_col: str,
+        write_column_counters=True,
+    ):
+        """Write an iterable of pyarrow RecordBatches to the database.  Each record batch is sent to a
+        parallel worker as it is, so should be of a sensible size (e.g. 10,000 rows).
+
+        Args:
+            record_batches (iterable): An iterable of pyarrow.RecordBatch with the same schema
+            unique_id_col (str): The column that contains the unique record identifier
+            write_column_counters (bool, optional): Whether to write token counts to the database once all
+                records have been processed.  Defaults to True.
+        """
+
+        # The record batches are sent to the workers as they are, which is much cheaper than pickling them
+        # as python objects, and are converted there
+        record_batches = (rb for rb in record_batches if rb.num_rows > 0)
+        first_batch = next(record_batches, None)
+        if first_batch is None:
+            logger.debug("No records to write")
+            return
+
+        first_row = first_batch.slice(0, 1).to_pydict()
+        self._setup_from_first_record(
+            {col: values[0] for col, values in first_row.items()}, unique_id_col
+        )
+
+        self._write_batches_parallel(
+            chain([first_batch], record_batches),
+            self._arrow_batch_to_insert_data,
+            write_column_counters=write_column_counters,
+        )
+
+    def begin_bulk_load(self):
+        """Put a new, empty database into bulk load mode, which is much faster for an initial build of a
+        large table.
+
+        While bulk loading, durability is relaxed and records are written to a staging table with no primary
+        key and no full text index.  finish_bulk_load() must be called once all records have been written.
+        It checks unique ids in a single pass, builds and optimises the full text index, and leaves
+        the database in the same state as if the records had been written normally.  abort_bulk_load()
+        abandons the load instead.
+        """
+        if self.bulk_loading:
+            raise ValueError("A bulk load is already in progress")
+        if not self._table_df_is_empty:
+            raise ValueError(
+                "Bulk load mode can only be used to build a new, empty database"
+            )
 
         c = self.conn.cursor()
-        for col in columns:
-            sql = f"""
-            update  {col}_token_counts
-            set token_proportion = cast(token_count as float)/(select sum(token_count) from {col}_token_counts)
+        c.execute(
             """
-            c.execute(sql)
-            self.conn.commit()
-            logger.debug(f"Updated table {col}_token_counts.")
+            CREATE TABLE df_bulk_load
+                (unique_id NOT NULL,
+                 original_record JSON,
+                 concat_all TEXT)
+            """
+        )
+        c.close()
+        self.conn.commit()
+
+        # If the load is interrupted, we can't guarantee the database is intact
+        self.conn.execute("PRAGMA synchronous = OFF")
+
+        self.set_key_value_to_db_state_table("bulk_load_in_progress", "true")
+        self.bulk_loading = True
+
+    def finish_bulk_load(self):
+        """Finish a bulk load started with begin_bulk_load(), see its docstring"""
+        if not self.bulk_loading:
+            raise ValueError("No bulk load is in progress")
 
+        start_time = datetime.now()
+        c = self.conn.cursor()
+
+        # Where a unique_id appears more than once, a normal write keeps the first record.
+        # df_bulk_load.unique_id has no type, so that the FTS table gets the original values as it would in
+        # a normal write, so cast it to match the primary key of df
+        c.execute(
+            """
+            CREATE TEMP TABLE bulk_load_first_rowids AS
+            SELECT min(rowid) as first_rowid
+            FROM df_bulk_load
+            GROUP BY cast(unique_id as TEXT)
+            """
+        )
+        c.execute(
+            """
+            INSERT INTO df
+            SELECT unique_id, original_record, concat_all
+            FROM df_bulk_load
+            WHERE rowid IN (SELECT first_rowid FROM temp.bulk_load_first_rowids)
+            ORDER BY cast(unique_id as TEXT)
+            """
+        )
+
+        c.execute(
+            """
+            SELECT original_record
+            FROM df_bulk_load
+            WHERE rowid NOT IN (SELECT first_rowid FROM temp.bulk_load_first_rowids)
+            """
+        )
+        duplicate_records = [json.loads(r["original_record"]) for r in c.fetchall()]
+
+        # Build the full text index in one go, with automerge turned off, then merge it into a single segment
+        c.execute("INSERT INTO fts_target(fts_target, rank) VALUES('automerge', 0)")
+        c.execute(
+            """
+            INSERT INTO fts_target
+            SELECT unique_id, concat_all
+            FROM df_bulk_load
+            WHERE rowid IN (SELECT first_rowid FROM temp.bulk_load_first_rowids)
+            """
+        )
+        c.execute("INSERT INTO fts_target(fts_target) VALUES('optimize')")
+        c.execute("INSERT INTO fts_target(fts_target, rank) VALUES('automerge', 4)")
+
+        c.execute("DROP TABLE temp.bulk_load_first_rowids")
+        c.execute("DROP TABLE df_bulk_load")
+        c.close()
+        self.conn.commit()
+        fts_result_cache.invalidate(self.cache_namespace)
+
+        if duplicate_records:
+            logger.info(
+                f"{len(duplicate_records)} records with duplicate unique ids were ignored"
+            )
+            self._remove_records_from_token_counts(duplicate_records)
+
+        self.conn.execute("PRAGMA synchronous = EXTRA")
+        self.set_key_value_to_db_state_table("bulk_load_in_progress", "false")
+        self.bulk_loading = False
+
+        logger.info(f"Finishing bulk load took {datetime.now() - start_time}")
+
+    def abort_bulk_load(self):
+        """Abandon a bulk load started with begin_bulk_load(), discarding any records written since, and
+        return the database to the new, empty state it was in before"""
+        if not self.bulk_loading:
+            raise ValueError("No bulk load is in progress")
+
+        # Discard any part-written batch
+        self.conn.rollback()
+        self._invalidate_token_stats()
+
+        # The token tables are created from the first record written, so drop them too in case the next
+        # load has different columns
+        c = self.conn.cursor()
+        c.execute("DROP TABLE df_bulk_load")
+        if self.example_record is not None:
+            for col in self.example_record.columns_to_index:
+                c.execute(f"DROP VIEW IF EXISTS {col}_token_counts")
+                c.execute(f"DROP TABLE IF EXISTS {col}_token_count_values")
+        c.execute("DROP TABLE IF EXISTS token_count_totals")
         c.close()
+        self.conn.commit()
+
+        self.conn.execute("PRAGMA synchronous = EXTRA")
+        self.set_key_value_to_db_state_table("unique_id_col", None)
+        self.set_key_value_to_db_state_table("col_counters_in_sync", "true")
+        self.set_key_value_to_db_state_table("bulk_load_in_progress", "false")
+        self.unique_id_col = None
+        self.example_record = None
+        self.column_counters = None
+        self.bulk_loading = False
+
+        logger.info("Bulk load aborted")
+
+    @contextmanager
+    def bulk_load(self):
+        """Context manager that calls begin_bulk_load() on entry and finish_bulk_load() on successful exit.
+        If the body raises an exception, the load is abandoned with abort_bulk_load()"""
+        self.begin_bulk_load()
+        try:
+            yield self
+        except BaseException:
+            self.abort_bulk_load()
+            raise
+        self.finish_bulk_load()
+
+    def _remove_records_from_token_counts(self, record_dicts):
+        """Subtract the tokens in record_dicts from the token counts in the database"""
+
+        # Make sure any counts not yet written include these records before we subtract them
+        if self.column_counters is not None:
+            self.write_all_col_counters_to_db()
+
+        self._invalidate_token_stats()
+
+        column_counters = ColumnCounters(self.example_record)
+        for record_dict in record_dicts:
+            insert_data = self._record_dict_to_insert_data(
+                record_dict,
+                unique_id_col=self.unique_id_col,
+                cols_to_ignore=self.cols_to_ignore,
+                dmeta_cols=self.dmeta_cols,
+            )
+            column_counters.update(insert_data["column_counters"])
+
+        c = self.conn.cursor()
+        for col in column_counters.columns:
+            negated = Counter({t: -n for t, n in column_counters[col].items()})
+            self._merge_counter_into_token_counts(c, col, negated)
+            c.execute(f"DELETE FROM {col}_token_count_values WHERE token_count <= 0")
+        c.execute("DROP TABLE IF EXISTS temp.token_counts_staging")
+        c.close()
+        self.conn.commit()
+
+    def _update_token_stats_tables(self):
+        # Token proportions in {col}_token_counts are derived from running totals held in token_count_totals,
+        # which are updated as token counts are written, so there is nothing to recompute here
+        self.conn.commit()
+
+    def rebuild_token_count_totals(self):
+        """Recompute the total token count of each column from scratch.  Only needed if the totals have
+        somehow got out of step with the token counts"""
+        self._invalidate_token_stats()
+        c = self.conn.cursor()
+        for col in self.example_record.columns_to_index:
+            c.execute(
+                f"""
+                UPDATE token_count_totals
+                SET total_token_count = (
+                    SELECT coalesce(sum(token_count), 0) FROM {col}_token_count_values
+                )
+                WHERE column_name = ?
+                """,
+                (col,),
+            )
+        c.close()
+        self.conn.commit()
 
     def build_or_replace_stats_tables(self):
         self._update_token_stats_tables()
+        self._write_token_stats()
+
+    def _write_token_stats(self):
+        """Write a memory-mapped snapshot of each column's token proportions next to the database file, which
+        searches use instead of querying {col}_token_counts.  See token_stats.py"""
+        if self.db_filename == ":memory:" or self.example_record is None:
+            return
+
+        start_time = datetime.now()
+        version = uuid.uuid4().hex
+        num_tokens = 0
+        for col in self.example_record.columns_to_index:
+            path = token_stats_path(self.db_filename, col)
+            num_tokens += write_token_stats(self.conn, col, path, version)
+        self.set_key_value_to_db_state_table("token_stats_version", version)
+
+        logger.info(
+            f"Wrote token stats snapshot of {num_tokens:,} tokens in {datetime.now() - start_time}"
+        )
 
-    def find_potental_matches(
-        self,
-        search_dict,
-        return_records_limit=50,
-        search_intensity=500,
-        individual_search_limit=50,
-    ):
+    def _invalidate_token_stats(self):
+        """Mark the token stats snapshot, and any token proportions already looked up, as out of date, because
+        the token counts are about to change"""
+        self.token_proportion_cache.clear()
+        if self.get_value_from_db_state_table("token_stats_version") is not None:
+            self.set_key_value_to_db_state_table("token_stats_version", None)
+
+    def token_stats(self, conn=None):
+        """The token stats snapshot of each column, if build_or_replace_stats_tables has written one since the
+        token counts last changed
+
+        Args:
+            conn (sqlite3.Connection, optional): The connection used to check the snapshot is up to date.
+                Defaults to self.conn
+
+        Returns:
+            dict: A TokenStats for each column, or an empty dict if there is no up to date snapshot
+        """
+        if self.db_filename == ":memory:" or self.example_record is None:
+            return {}
+
+        version = self.get_value_from_db_state_table("token_stats_version", conn=conn)
+        if version is None:
+            return {}
+
+        with self._token_stats_lock:
+            if version != self._token_stats_version:
+                # Snapshots that are replaced are not closed, because searches in other threads may be
+                # using them.  They're closed when they're garbage collected
+                self._token_stats = open_token_stats(
+                    self.db_filename, self.example_record.columns_to_index, version
+                )
+                self._token_stats_version = version
+            return self._token_stats
+
+    @contextmanager
+    def _match_finder(self, search_dict, **search_options):
+        """Check out a read connection and create a MatchFinder for search_dict that uses it.  search_dict is
+        copied, and given a unique id that can't be mistaken for the id of a record in the database.
+        search_options are passed to MatchFinder"""
+        search_dict = copy.deepcopy(search_dict)
         if self.unique_id_col not in search_dict:
             search_dict[self.unique_id_col] = "search_record_" + uuid.uuid4().hex
         else:
             search_dict[self.unique_id_col] = (
-                str(search_dict[self.unique_id_col]) + uuid.uuid4().hex
+                str(search_dict[self.unique_id_col]) + " " + uuid.uuid4().hex
             )
 
-        finder = MatchFinder(
-            search_dict,
-            self,
-            return_records_limit=return_records_limit,
-            search_intensity=search_intensity,
-            individual_search_limit=individual_search_limit,
-        )
-        finder.find_potential_matches()
-        return finder.found_records
+        with self.read_connection() as conn:
+            yield MatchFinder(search_dict, self, conn=conn, **search_options)
 
-    def find_potential_matches_as_pandas(
+    def find_potental_matches(
         self,
         search_dict,
         return_records_limit=50,
         search_intensity=500,
         individual_search_limit=50,
+        cancel_event=None,
+        max_search_seconds=None,
+        max_queries=None,
+        top_k=None,
+        planned_search=True,
     ):
+        """Find records in the database that potentially match search_dict
 
-        search_dict = copy.deepcopy(search_dict)
-        if self.unique_id_col not in search_dict:
-            search_dict[self.unique_id_col] = "search_record_" + uuid.uuid4().hex
-        else:
-            search_dict[self.unique_id_col] = (
-                str(search_dict[self.unique_id_col]) + " " + uuid.uuid4().hex
-            )
+        Args:
+            search_dict (dict): The record to search for
+            return_records_limit (int, optional): Stop searching once more than this many records are found.
+                Defaults to 50.
+            search_intensity (int, optional): The maximum number of token combinations to search for once the
+                most specific searches have run.  Defaults to 500.
+            individual_search_limit (int, optional): The maximum number of results from a single FTS query.
+                Queries that reach this limit are discarded.  Defaults to 50.
+            cancel_event (threading.Event, optional): If this is set, no further queries are run.
+                Defaults to None.
+            max_search_seconds (float, optional): Stop searching after this many seconds and return the records
+                found so far.  Defaults to None, meaning no time limit.
+            max_queries (int, optional): Stop searching after this many FTS queries and return the records
+                found so far.  Defaults to None, meaning no limit.
+            top_k (int, optional): Only return the top_k best scoring records.  Searching stops once no record
+                that hasn't been found could score better than them.  Defaults to None.
+            planned_search (bool, optional): Plan which combinations of tokens to search for using how many
+                records contain each token, which is deterministic and runs fewer queries.  If False, the
+                combinations are chosen at random.  Defaults to True.
 
-        finder = MatchFinder(
+        Returns:
+            FoundRecords: A dict of the records found, keyed by unique id.  The record dicts include score and
+                bm25_score.  Its search_budget_exhausted attribute is True if the search was stopped by
+                max_search_seconds or max_queries
+        """
+        with self._match_finder(
             search_dict,
-            self,
             return_records_limit=return_records_limit,
             search_intensity=search_intensity,
             individual_search_limit=individual_search_limit,
-        )
-        finder.find_potential_matches()
+            cancel_event=cancel_event,
+            max_search_seconds=max_search_seconds,
+            max_queries=max_queries,
+            top_k=top_k,
+            planned_search=planned_search,
+        ) as finder:
+            finder.find_potential_matches()
+        return FoundRecords(finder.found_records, finder.search_budget_exhausted)
+
+    def find_potential_matches_as_pandas(self, search_dict, **search_options):
+        """As find_potental_matches, and taking the same arguments, returning the records as a pandas dataframe
+        sorted by score.  Its search_budget_exhausted column, and df.attrs["search_budget_exhausted"], are True
+        if the search was stopped by max_search_seconds or max_queries"""
+        with self._match_finder(search_dict, **search_options) as finder:
+            finder.find_potential_matches()
         return finder.found_records_as_df
 
+    def iter_potential_matches(self, search_dict, **search_options):
+        """As find_potental_matches, and taking the same arguments, but returns an iterator that yields each
+        record dict as soon as the query that found it has run.  Records are yielded in the order they are found,
+        not by score.  The search stops, and its read connection is returned to the pool, when the iterator is
+        exhausted or closed, e.g. by breaking out of a for loop over it.  The iterator's search_budget_exhausted
+        attribute is True once the search has been stopped by max_search_seconds or max_queries"""
+        return PotentialMatchesIterator(self, search_dict, search_options)
+
+    async def find_potential_matches_async(self, search_dict, **search_options):
+        """As find_potental_matches, and taking the same arguments except cancel_event, but the search runs in a
+        thread so it does not block the event loop.  If the awaiting task is cancelled, the search stops before
+        its next FTS query"""
+        return await self._search_async(
+            self.find_potental_matches, search_dict, **search_options
+        )
+
+    async def find_potential_matches_as_pandas_async(
+        self, search_dict, **search_options
+    ):
+        """As find_potential_matches_as_pandas, but the search runs in a thread so it does not block the
+        event loop.  If the awaiting task is cancelled, the search stops before its next FTS query"""
+        return await self._search_async(
+            self.find_potential_matches_as_pandas, search_dict, **search_options
+        )
+
+    async def _search_async(self, search_function, search_dict, **search_kwargs):
+        # Inside a coroutine this returns the running loop.  get_running_loop needs Python 3.7+
+        loop = asyncio.get_event_loop()
+        cancel_event = threading.Event()
+        search = partial(
+            search_function, search_dict, cancel_event=cancel_event, **search_kwargs
+        )
+        try:
+            return await loop.run_in_executor(self.search_executor, search)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+
+    @property
+    def search_executor(self):
+        """The threads that run async searches.  Each search checks out its own read connection"""
+        if self._search_executor is None:
+            with self._read_pool_lock:
+                if self._search_executor is None:
+                    # An in-memory database has a single connection, so its searches run one at a time
+                    max_workers = 1 if self.db_filename == ":memory:" else None
+                    self._search_executor = ThreadPoolExecutor(
+                        max_workers=max_workers or self.max_read_connections,
+                        thread_name_prefix="fuzzyfinder-search",
+                    )
+        return self._search_executor
+
+    def find_matches_batch(
+        self,
+        search_records,
+        search_id_col: str = None,
+        chunk_size: int = 100,
+        processes: int = None,
+        **search_options,
+    ):
+        """Find potential matches for many search records, sharing the searches between worker processes.
+        Each worker opens its own read only connection to the database file.
+
+        Args:
+            search_records (iterable): A pandas dataframe or an iterable of search dicts
+            search_id_col (str, optional): The field that identifies each search record in the results.
+                Defaults to the unique id column of the database.  Search records without this field are
+                identified by their position in search_records.
+            chunk_size (int, optional): How many search records to send to a worker at a time.  Defaults to 100.
+            processes (int, optional): The number of worker processes.  Defaults to the processes
+                of this database.
+            **search_options: Passed to find_potental_matches for each search record, e.g. return_records_limit,
+                search_intensity or top_k
+
+        Returns:
+            list: One dict per (search record, candidate) with keys search_id, candidate_id, score, bm25_score
+                and search_budget_exhausted, which is True if the search for the record was stopped by
+                max_search_seconds or max_queries.  Ordered by search record then descending score
+        """
+        if self.db_filename == ":memory:":
+            raise ValueError(
+                "Batch search requires a database file, use find_potental_matches to search "
+                "an in-memory database"
+            )
+
+        if hasattr(search_records, "to_dict"):
+            search_records = pandas_dataframe_to_records(search_records, chunk_size)
+
+        search_id_col = search_id_col or self.unique_id_col
+        searches = (
+            _search_id_and_dict(
+                position, search_dict, search_id_col, self.unique_id_col
+            )
+            for position, search_dict in enumerate(search_records)
+        )
+
+        # Workers can only see committed records
+        self.conn.commit()
+
+        search_worker = partial(_find_matches_for_searches, **search_options)
+
+        start_time = time.time()
+        context = multiprocessing.get_context(self.start_method)
+        results = []
+        with context.Pool(
+            processes=processes or self.processes,
+            initializer=_init_search_worker,
+            initargs=(self.db_filename,),
+        ) as pool:
+            for rows in pool.imap(search_worker, chunk_iterable(searches, chunk_size)):
+                results.extend(rows)
+
+        logger.info(
+            f"Found {len(results):,.0f} potential matches in "
+            f"{time.time() - start_time:.1f} seconds"
+        )
+        return results
+
+    def find_matches_batch_as_pandas(self, search_records, **batch_options):
+        """As find_matches_batch, and taking the same arguments, returning the results as a pandas dataframe"""
+        try:
+            import pandas as pd
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "You've asked for the results as a pandas dataframe but pandas is not installed"
+            )
+
+        results = self.find_matches_batch(search_records, **batch_options)
+        return pd.DataFrame(
+            results,
+            columns=[
+                "search_id",
+                "candidate_id",
+                "score",
+                "bm25_score",
+                "search_budget_exhausted",
+            ],
+        )
+
+
+# Each batch search worker process holds a read only connection to the database, see find_matches_batch
+_search_worker_db = None
+
+
+def _init_search_worker(db_filename):
+    global _search_worker_db
+    _search_worker_db = SearchDatabase(db_filename, read_only=True)
+
 
-def chunk_list(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
+def _search_id_and_dict(position, search_dict, search_id_col, unique_id_col):
+    search_dict = dict(search_dict)
+    if search_id_col not in search_dict:
+        return position, search_dict
+    if search_id_col == unique_id_col:
+        return search_dict[search_id_col], search_dict
+    return search_dict.pop(search_id_col), search_dict
+
+
+def _find_matches_for_searches(searches, **search_kwargs):
+    rows = []
+    for search_id, search_dict in searches:
+        found_records = _search_worker_db.find_potental_matches(
+            search_dict, **search_kwargs
+        )
+        found = sorted(
+            found_records.items(), key=lambda item: item[1]["score"], reverse=True
+        )
+        for candidate_id, record in found:
+            rows.append(
+                {
+                    "search_id": search_id,
+                    "candidate_id": candidate_id,
+                    "score": record["score"],
+                    "bm25_score": record["bm25_score"],
+                    "search_budget_exhausted": found_records.search_budget_exhausted,
+                }
+            )
+    return rows
+
+
+class PotentialMatchesIterator:
+    """
+    Iterates over the records found by a search as they are found, see SearchDatabase.iter_potential_matches.
+    search_budget_exhausted is True once the search has been stopped by max_search_seconds or max_queries
+    """
+
+    def __init__(self, db, search_dict, search_options):
+        # The generator only refers to this list, not to self, so it's closed as soon as self is discarded
+        self._finders = []
+        self._records = _iter_potential_matches(
+            db, search_dict, search_options, self._finders
+        )
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._records)
+
+    def close(self):
+        """Stop the search and return its read connection to the pool"""
+        self._records.close()
+
+    @property
+    def search_budget_exhausted(self):
+        return bool(self._finders) and self._finders[0].search_budget_exhausted
+
+
+def _iter_potential_matches(db, search_dict, search_options, finders):
+    with db._match_finder(search_dict, **search_options) as finder:
+        finders.append(finder)
+        yield from finder.iter_potential_matches()
+
+
+def chunk_iterable(iterable, n):
+    """Yield successive n-sized lists from any iterable, consuming it lazily."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _record_completion_time(completed_at, batch_number, _):
+    # Called in the parent process when a worker finishes a batch
+    completed_at[batch_number] = time.perf_counter()
+
+
+def _results_batch_size(results_batch):
+    """A rough estimate of the memory, in bytes, held by a processed batch.  The original records are
+    assumed to be about the same size as their json"""
+    return sum(
+        2 * len(jsond) + len(concat)
+        for _, jsond, concat in results_batch["result_tuples"]
+    )
+
+
+def _per_second(n, duration):
+    seconds = duration.total_seconds()
+    if seconds == 0:
+        return float("inf")
+    return n / seconds
+
+
+def _split_concat_by_column(concat, columns, token_lengths):
+    """Split a record's concat_all back into (column, tokens) pairs, given the number of tokens from
+    each column.  Returns None if the split cannot be reversed because a token contains a space"""
+    # An empty string is either no tokens or a single empty token, which the lengths tell apart
+    if sum(token_lengths) == 0:
+        return [(col, []) for col in columns]
+    tokens = concat.split(" ")
+    if len(tokens) != sum(token_lengths):
+        return None
+    row_tokens = []
+    start = 0
+    for col, length in zip(columns, token_lengths):
+        row_tokens.append((col, tokens[start : start + length]))
+        start += length
+    return row_tokens
+
+
+def _json_default(o):
+    # Pandas' nullable types (e.g. pd.NA) are not json serialisable
+    if "NA" in repr(type(o)):
+        return None
+    else:
+        return int(o)
+
+
+def pandas_dataframe_to_records(pd_df, batch_size):
+    """Yield the rows of a pandas dataframe as dicts, converting batch_size rows at a time
+    rather than materialising the whole dataframe as a list of dicts"""
+    for start in range(0, len(pd_df), batch_size):
+        yield from pd_df.iloc[start : start + batch_size].to_dict(orient="records")
 
 
 class ColumnCounters:
@@ -632,6 +1926,13 @@ class ColumnCounters:
     def update_single_column(self, col, new_counter):
         self.col_token_counts[col].update(new_counter)
 
+    def subtract_single_column(self, col, tokens):
+        counter = self.col_token_counts[col]
+        counter.subtract(tokens)
+        for token in set(tokens):
+            if counter[token] <= 0:
+                del counter[token]
+
     def update(self, new_column_counters):
         for col in self.columns:
             new_counter = new_column_counters[col]
@@ -639,3 +1940,137 @@ class ColumnCounters:
 
     def __repr__(self):
         return self.col_token_counts.__repr__()
+
+
+# State of a worker process in SearchDatabase.pool.  The token counts of the batches the worker has processed,
+# keyed by the write_id of the write they belong to, and the number of tasks it has run
+_worker_column_counters = {}
+_worker_tasks_run = 0
+_worker_barrier = None
+
+
+def _init_write_worker(barrier):
+    global _worker_barrier
+    _worker_barrier = barrier
+
+
+def _batch_to_insert_data_in_worker(
+    batch, batch_to_insert_data, write_id, maxtasksperchild, **kwargs
+):
+    """Run batch_to_insert_data in a worker process, adding the batch's token counts to the worker's own
+    counts rather than returning them.  The worker's counts are only returned if this is the last task it
+    will run before it's replaced"""
+    global _worker_tasks_run
+    _worker_tasks_run += 1
+
+    results_batch = batch_to_insert_data(batch, **kwargs)
+    column_counters = results_batch["column_counters"]
+    # Needed to split concat_all back into columns, see _column_counters_for_positions
+    results_batch["columns"] = list(column_counters.columns)
+
+    if write_id in _worker_column_counters:
+        _worker_column_counters[write_id].update(column_counters)
+    else:
+        _worker_column_counters[write_id] = column_counters
+
+    if maxtasksperchild and _worker_tasks_run >= maxtasksperchild:
+        results_batch["column_counters"] = _worker_column_counters.pop(write_id)
+    else:
+        results_batch["column_counters"] = None
+    results_batch["worker_pid"] = os.getpid()
+    return results_batch
+
+
+def _collect_worker_column_counters(write_id, timeout):
+    """Return this worker's pid and its token counts for write_id.  Counts from any other write are from a
+    write that failed, and are discarded.
+
+    Waits at the barrier until every worker is running this task, so that when one task is submitted per
+    worker, each worker runs exactly one of them"""
+    global _worker_tasks_run
+    _worker_tasks_run += 1
+
+    column_counters = _worker_column_counters.pop(write_id, None)
+    _worker_column_counters.clear()
+    try:
+        _worker_barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        pass
+    return os.getpid(), column_counters
+
+
+class WorkerColumnCounters:
+    """
+    The token counts of the records written by one call to SearchDatabase._write_batches_parallel.
+
+    Each worker process adds up the token counts of the batches it processes, so they aren't sent back to
+    the process writing to the database a batch at a time.  A worker sends its counts with the result of its
+    last batch if it's about to be replaced (see maxtasksperchild), and otherwise when result() is called at
+    the end of the write.  So the writer merges a few large counters rather than one per batch.
+
+    Records that aren't inserted because their unique id is already in the database are passed to skip(),
+    and subtracted from the total
+    """
+
+    def __init__(self, pool, processes, barrier, example_record, timeout=60):
+        self.pool = pool
+        self.processes = processes
+        self.barrier = barrier
+        self.timeout = timeout
+        self.write_id = uuid.uuid4().hex
+
+        # The pids of workers that hold counts for this write which haven't been received
+        self._workers_with_counts = set()
+        self._column_counters = None
+        self._skipped = ColumnCounters(example_record)
+        self.num_received = 0
+
+    def _receive(self, column_counters):
+        self.num_received += 1
+        if self._column_counters is None:
+            self._column_counters = column_counters
+        else:
+            self._column_counters.update(column_counters)
+
+    def add_results_batch(self, results_batch):
+        """Note which worker holds the token counts of results_batch, or receive them if they were sent"""
+        pid = results_batch["worker_pid"]
+        if results_batch["column_counters"] is None:
+            self._workers_with_counts.add(pid)
+        else:
+            self._receive(results_batch["column_counters"])
+            self._workers_with_counts.discard(pid)
+
+    def skip(self, column_counters):
+        self._skipped.update(column_counters)
+
+    def result(self):
+        """Collect the counts held by the workers and return the total as a ColumnCounters, or None if no
+        batches were written"""
+        # Each round runs one collection task in each worker, unless the barrier times out
+        for _ in range(3):
+            if not self._workers_with_counts:
+                break
+            async_results = [
+                self.pool.apply_async(
+                    _collect_worker_column_counters, (self.write_id, self.timeout)
+                )
+                for _ in range(self.processes)
+            ]
+            for async_result in async_results:
+                pid, column_counters = async_result.get()
+                if column_counters is not None:
+                    self._receive(column_counters)
+                self._workers_with_counts.discard(pid)
+            if self.barrier.broken:
+                self.barrier.reset()
+
+        if self._workers_with_counts:
+            raise RuntimeError(
+                "Could not collect the token counts from every worker process"
+            )
+
+        if self._column_counters is not None:
+            for col in self._skipped.columns:
+                self._column_counters.subtract_single_column(col, self._skipped[col])
+        return self._column_counters
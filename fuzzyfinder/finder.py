@@ -1,15 +1,33 @@
+from itertools import chain
+import heapq
 import json
-from math import inf
 import random
+import re
+from math import inf, log10
+import sqlite3
+import time
 
 
-from .comparison import RecordComparisonScorer
+from .cache import fts_result_cache
+from .comparison import BatchRecordScorer, PreparedSearchRecord
 from .record import Record
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Tokens that the FTS tokenizer indexes as a single term
+_FTS_TERM = re.compile(r"[a-z0-9]+")
+
+
+class FoundRecords(dict):
+    """The records found by a search, keyed by unique id.  search_budget_exhausted is True if the search was
+    stopped by max_search_seconds or max_queries, in which case there may be matches it didn't find"""
+
+    def __init__(self, records, search_budget_exhausted=False):
+        super().__init__(records)
+        self.search_budget_exhausted = search_budget_exhausted
+
 
 class MatchFinder:
     def __init__(
@@ -20,14 +38,23 @@ class MatchFinder:
         best_score_threshold=inf,
         search_intensity=500,
         individual_search_limit=50,
+        conn=None,
+        cancel_event=None,
+        max_search_seconds=None,
+        max_queries=None,
+        top_k=None,
+        planned_search=True,
     ):
 
-        self.conn = db.conn
+        # Searches may use a connection checked out from the database's read connection pool
+        self.conn = conn or db.conn
+        self.cache_namespace = db.cache_namespace
 
         self.unique_id_col = db.unique_id_col
 
         self.cols_to_ignore = db.cols_to_ignore
         self.dmeta_cols = db.dmeta_cols
+        self.token_stats = db.token_stats(self.conn)
 
         if self.unique_id_col not in search_dict:
             search_dict[self.unique_id_col] = "search_record"
@@ -44,9 +71,11 @@ class MatchFinder:
         self.record = Record(
             search_dict,
             self.unique_id_col,
-            db.conn,
+            self.conn,
             cols_to_ignore=self.cols_to_ignore,
             dmeta_cols=self.dmeta_cols,
+            token_stats=self.token_stats,
+            token_proportion_cache=db.token_proportion_cache,
         )
 
         self.number_of_searches = 0
@@ -56,18 +85,76 @@ class MatchFinder:
         self.individual_search_limit = individual_search_limit
 
         self.found_records = {}
+        self._prepared_search_rec = None
+        self._batch_scorer = None
+
+        # Records found by the most recent query, see _search_steps
+        self._new_records = []
 
         self.best_score = -inf
 
         self._searches = set()
 
+        # Searches whose results show that other searches are redundant, see _plan_searches
+        self._complete_searches = []
+        self._discarded_searches = []
+        self._record_count = None
+        self._doc_counts = None
+        self.number_of_skipped_searches = 0
+
+        # If this threading.Event is set, e.g. because an async search was cancelled, no further
+        # queries are run
+        self.cancel_event = cancel_event
+
+        # Optional limits on the time taken and number of FTS queries run by find_potential_matches.
+        # Once either is reached, the next query isn't run, search_budget_exhausted is set and searching stops
+        self.max_search_seconds = max_search_seconds
+        self.max_queries = max_queries
+        self.search_budget_exhausted = False
+        self._deadline = None
+
+        # In top k mode, only the top_k best scoring records are returned, and searching stops once no
+        # record that hasn't been found could score better than all of them.  See _best_possible_unseen_score
+        self.top_k = top_k
+        self._top_scores = []
+        self._score_losses = None
+        self._unseen_score_bound = None
+
+        # The last search strategy searches for combinations of tokens planned using how many records contain
+        # each token, see _search_planned, which is deterministic and runs fewer queries than searching for
+        # random combinations.  If planned_search is False, random combinations are searched for instead
+        self.planned_search = planned_search
+
+    @property
+    def prepared_search_rec(self):
+        """The search record's tokens and token proportions, prepared once for scoring all its potential
+        matches.  See PreparedSearchRecord"""
+        if self._prepared_search_rec is None:
+            self._prepared_search_rec = PreparedSearchRecord(self.record)
+        return self._prepared_search_rec
+
+    @property
+    def batch_scorer(self):
+        if self._batch_scorer is None:
+            self._batch_scorer = BatchRecordScorer(
+                self.record, self.prepared_search_rec
+            )
+        return self._batch_scorer
+
+    @property
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
     @property
     def found_records_as_df(self):
         try:
             import pandas as pd
 
             df = pd.DataFrame(self.found_records.values())
-            return df.sort_values("score", ascending=False)
+            df = df.sort_values("score", ascending=False)
+            df["search_budget_exhausted"] = self.search_budget_exhausted
+            df.attrs["search_budget_exhausted"] = self.search_budget_exhausted
+            return df
         except ModuleNotFoundError:
             raise ModuleNotFoundError(
                 "You've asked for the results as a pandas dataframe but pandas is not installed"
@@ -75,41 +162,107 @@ class MatchFinder:
 
     def find_potential_matches(self):
 
+        for _ in self._search_steps():
+            pass
+        self._finish_search()
+
+    def iter_potential_matches(self):
+        """
+        Search as find_potential_matches does, yielding each record as soon as the query that found it has
+        run, so the best candidates can be used before the search is complete.  Records are yielded in the
+        order they are found, not by score, and include score and bm25_score.
+
+        The search stops if the generator is closed, e.g. by breaking out of a for loop over it.  In top k mode
+        every record found is yielded, but found_records is trimmed to the top_k best once the search is done
+        """
+        for new_records in self._search_steps():
+            yield from new_records
+        self._finish_search()
+
+    def _finish_search(self):
+        if self.top_k is not None:
+            top_ids = sorted(
+                self.found_records,
+                key=lambda rec_id: self.found_records[rec_id]["score"],
+                reverse=True,
+            )[: self.top_k]
+            self.found_records = {
+                rec_id: self.found_records[rec_id] for rec_id in top_ids
+            }
+
+        logger.info(f"Total records found: {len(self.found_records.keys())}")
+        logger.info(f"Total searches executed: {self.number_of_searches}")
+
+    def _search_steps(self):
+        """Run the search strategies in turn, yielding the list of records found by each query"""
+
+        if self.max_search_seconds is not None:
+            self._deadline = time.monotonic() + self.max_search_seconds
+
         strategies = [
             self._search_specific_to_general_all_tokens,
             self._search_specific_to_general_band,
-            self._search_random,
+            self._search_planned if self.planned_search else self._search_random,
         ]
 
         for strategy in strategies:
             if self.stop_searching(None):
-                return None
-            strategy()
+                break
+            for _ in strategy():
+                new_records, self._new_records = self._new_records, []
+                yield new_records
             logger.debug(f"Total searches executed so far: {self.number_of_searches}")
-        logger.info(f"Total records found: {len(self.found_records.keys())}")
-        logger.info(f"Total searches executed: {self.number_of_searches}")
 
     def add_record_if_not_exists(self, r):
-        rec_id = r["unique_id"]
-        if rec_id not in self.found_records:
-            record_dict = self.get_record_dict_from_id(rec_id)
+        self.add_records_if_not_exist([r])
+
+    def add_records_if_not_exist(self, rows):
+        """Score and add the records in rows, a list of FTS results, that haven't been found already.
+        The new records are scored together, see BatchRecordScorer"""
+        new_rows = {}
+        for r in rows:
+            if r["unique_id"] not in self.found_records:
+                new_rows.setdefault(r["unique_id"], r)
+        if not new_rows:
+            return
 
-            found_record = Record(
+        record_dicts = []
+        for rec_id, r in new_rows.items():
+            if r.get("original_record") is not None:
+                record_dicts.append(json.loads(r["original_record"]))
+            else:
+                record_dicts.append(self.get_record_dict_from_id(rec_id))
+
+        found_records = [
+            Record(
                 record_dict,
                 self.unique_id_col,
                 self.conn,
                 cols_to_ignore=self.cols_to_ignore,
                 dmeta_cols=self.dmeta_cols,
+                token_stats=self.token_stats,
             )
-            scorer = RecordComparisonScorer(self.record, found_record)
-            score = scorer.score
+            for record_dict in record_dicts
+        ]
+        scores = self.batch_scorer.scores(found_records)
+
+        for r, record_dict, score in zip(new_rows.values(), record_dicts, scores):
+            self._add_scored_record(r, record_dict, score)
 
-            record_dict["score"] = score
-            record_dict["bm25_score"] = r["bm25_score"]
+    def _add_scored_record(self, r, record_dict, score):
+        record_dict["score"] = score
+        record_dict["bm25_score"] = r["bm25_score"]
 
-            self.found_records[rec_id] = record_dict
+        self.found_records[r["unique_id"]] = record_dict
+        self._new_records.append(record_dict)
 
-            self.best_score = max(score, self.best_score)
+        self.best_score = max(score, self.best_score)
+
+        if self.top_k is not None:
+            if len(self._top_scores) < self.top_k:
+                heapq.heappush(self._top_scores, score)
+            else:
+                heapq.heappushpop(self._top_scores, score)
 
     def get_record_dict_from_id(self, rec_id):
 
@@ -132,6 +285,20 @@ class MatchFinder:
         if frozenset(tokens) in self._searches:
             return
 
+        if self.cancelled:
+            return
+
+        skipped_results = self._results_without_searching(tokens)
+        if skipped_results:
+            self._searches.add(frozenset(tokens))
+            self.number_of_skipped_searches += 1
+            return skipped_results
+
+        # The budget only counts as exhausted if it stops a query from running
+        if self._budget_reached():
+            self.search_budget_exhausted = True
+            return
+
         self._searches.add(frozenset(tokens))
 
         self.number_of_searches = self.number_of_searches + 1
@@ -144,31 +311,101 @@ class MatchFinder:
 
         fts_string = " ".join(escaped_tokens)
 
+        # Fetch the matching records in the same statement, so found records don't each need a
+        # separate lookup in df.  Records are only decoded if they haven't been found already
         sql = f"""
-            SELECT unique_id, bm25(fts_target) as bm25_score
-            FROM fts_target
-            WHERE concat_all
-            MATCH
-            '{fts_string}'
-            LIMIT {self.individual_search_limit}
+            SELECT fts.unique_id, fts.bm25_score, df.original_record
+            FROM (
+                SELECT unique_id, bm25(fts_target) as bm25_score
+                FROM fts_target
+                WHERE concat_all
+                MATCH
+                '{fts_string}'
+                LIMIT {self.individual_search_limit}
+            ) as fts
+            LEFT JOIN df
+            ON df.unique_id = cast(fts.unique_id as TEXT)
             """
-        logger.debug(f"Searching for {fts_string}")
-        cur = self.conn.cursor()
-        cur.execute(sql)
-        results = cur.fetchall()
+        # Identical queries are often run by different searches, e.g. a common first name and surname
+        cache_key = (
+            self.cache_namespace,
+            frozenset(tokens),
+            self.individual_search_limit,
+        )
+        results = fts_result_cache.get(cache_key)
+        if results is None:
+            logger.debug(f"Searching for {fts_string}")
+            cur = self.conn.cursor()
+            cur.execute(sql)
+            results = cur.fetchall()
+            cur.close()
+            fts_result_cache.put(cache_key, results)
         num_results = len(results)
 
         if (
             num_results < self.return_records_limit
         ):  # If query hit results limit then results unlikely to be useful
-            for r in results:
-                self.add_record_if_not_exists(r)
+            self.add_records_if_not_exist(results)
+            if num_results < self.individual_search_limit:
+                self._add_complete_search(tokens)
+        else:
+            self._discarded_searches.append(frozenset(tokens))
 
         num_ids_after = len(self.found_records.keys())
         num_new = num_ids_after - num_ids_before
         return {"num_new_recs_found": num_new, "num_results": num_results}
 
+    def _budget_reached(self):
+        if self.max_queries is not None and self.number_of_searches >= self.max_queries:
+            return True
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            return True
+        return False
+
+    def _add_complete_search(self, tokens):
+        """Record a search that found every record containing all its tokens"""
+        self._complete_searches.append(frozenset(tokens))
+        self._unseen_score_bound = None
+
+    def _token_score_losses(self):
+        """
+        For each token in the search record, the least the score of a record that doesn't contain it falls
+        short of a perfect match.  In RecordComparisonScorer, a matching token multiplies the probability by
+        its proportion p, so the record misses out on -log10(p) / 30 for each column the token appears in
+        """
+        if self._score_losses is None:
+            losses = {}
+            for col, token_probs in self.record.token_probabilities.items():
+                for token, value in token_probs.items():
+                    p = value["proportion"]
+                    if p == "does_not_exist_in_db" or not p:
+                        continue
+                    losses[token] = losses.get(token, 0) - log10(p)
+            self._score_losses = losses
+        return self._score_losses
+
+    def _best_possible_unseen_score(self):
+        """
+        An upper bound on the score of any record that hasn't been found yet.  Such a record contains none of
+        the complete searches' token sets, so at best it matches the most valuable subset of the search tokens
+        that doesn't contain one of them
+        """
+        if self._unseen_score_bound is None:
+            losses = self._token_score_losses()
+            best_match = _max_weight_avoiding(losses, self._complete_searches)
+            if best_match is None:
+                best_match = sum(losses.values()) - _disjoint_min_weight(
+                    losses, self._complete_searches
+                )
+            self._unseen_score_bound = best_match / 30
+        return self._unseen_score_bound
+
     def stop_searching(self, results):
+        if self.cancelled or self.search_budget_exhausted:
+            return True
+        if self.top_k is not None and len(self._top_scores) == self.top_k:
+            if self._top_scores[0] >= self._best_possible_unseen_score():
+                return True
         if self.best_score > self.best_score_threshold:
             return True
         if len(self.found_records.keys()) > self.return_records_limit:
@@ -202,6 +439,7 @@ class MatchFinder:
         for i in range(len(tkns_rarity_order)):
             sub_tokens = tkns_rarity_order[i:]
             results = self._fts_using_tokens(sub_tokens)
+            yield results
             if self.stop_searching(results):
                 break
 
@@ -239,6 +477,7 @@ class MatchFinder:
                 sub_tokens = tkns_rarity_order[start_pos:end_pos]
 
                 results = self._fts_using_tokens(sub_tokens)
+                yield results
 
                 if self.stop_searching(results):
                     break
@@ -251,6 +490,9 @@ class MatchFinder:
         logger.debug(f"{num_new} new matches found")
 
     def _search_random(self):
+        """
+        Search random combinations of between two and n-1 tokens.  At most search_intensity searches are run
+        """
 
         logger.debug("Starting random search")
 
@@ -262,7 +504,7 @@ class MatchFinder:
 
             for i in range(self.search_intensity):
                 random_tokens = self._get_random_tokens(tkns_rarity_order)
-                self._fts_using_tokens(random_tokens)
+                yield self._fts_using_tokens(random_tokens)
 
                 if self.stop_searching(None):
                     break
@@ -276,3 +518,319 @@ class MatchFinder:
         n = random.randint(2, num_tokens - 1)
         random_tokens = random.sample(tokens, n)
         return tuple(random_tokens)
+
+    def _search_planned(self):
+        """
+        Search combinations of between two and n-1 tokens, in an order planned using the proportion of
+        records that contain each token.  See _plan_searches.  At most search_intensity searches are run
+        """
+
+        logger.debug("Starting planned search")
+
+        num_found_records_old = len(self.found_records.keys())
+
+        token_weights = self._token_weights()
+        num_records = self._num_records()
+
+        if len(token_weights) > 2 and num_records:
+
+            # The results of a search are only used if there are fewer than this many of them
+            max_results = min(self.individual_search_limit, self.return_records_limit)
+            min_weight = log10(num_records / max_results)
+
+            num_searches_before = self.number_of_searches
+            for tokens in self._plan_searches(token_weights, min_weight):
+                yield self._fts_using_tokens(tokens)
+
+                if self.stop_searching(None):
+                    break
+                num_searches = self.number_of_searches - num_searches_before
+                if num_searches >= self.search_intensity:
+                    break
+
+        num_found_records_new = len(self.found_records.keys())
+        num_new = num_found_records_new - num_found_records_old
+        logger.debug(f"{num_new} new matches found")
+
+    def _plan_searches(self, token_weights, min_weight):
+        """
+        Yield combinations of tokens to search for, smallest combinations first and, for each size, in order
+        of their expected number of results, fewest first.  The expected number of results assumes tokens
+        occur independently, except that a token and its dmetaphone tokens are counted as one, see
+        _combination_weight.
+
+        A combination is not searched for if an earlier search shows it can't find anything new.  A combination
+        whose weight is min_weight or less, meaning it's expected to return too many results to be used, is put
+        off until every other combination has been searched for.  Tokens are often correlated, so the expected
+        number of results can be far too high, and these combinations are then searched for, heaviest first,
+        for as long as the search budget allows.  Those that the number of records containing each token shows
+        would return too many results are not run, see _results_without_searching.
+        A combination is only extended with more tokens if searching for it returned, or is expected to
+        return, too many results
+        """
+        tokens = sorted(token_weights, key=lambda t: (token_weights[t], t))
+        weights = [token_weights[t] for t in tokens]
+        num_tokens = len(tokens)
+        max_combinations = 50 * self.search_intensity
+        source_tokens = self._source_tokens()
+        sources = [source_tokens.get(t, t) for t in tokens]
+
+        # Combinations expected to return too many results, see above
+        deferred = []
+
+        # Combinations, as positions in tokens, which could usefully be extended with another token
+        extendable = [
+            (i,)
+            for i in range(num_tokens)
+            if not self._search_is_superset_of_complete((tokens[i],))
+        ]
+
+        for size in range(2, num_tokens):
+            combinations = []
+            for positions in extendable:
+                for i in range(positions[-1] + 1, num_tokens):
+                    combination = positions + (i,)
+                    weight = _combination_weight(combination, weights, sources)
+                    combinations.append((weight, combination))
+            combinations = sorted(combinations)[:max_combinations]
+            max_combinations -= len(combinations)
+
+            extendable = []
+            for weight, positions in reversed(combinations):
+                combination = tuple(tokens[i] for i in positions)
+                if self._search_is_superset_of_complete(combination):
+                    continue
+                if self._search_is_subset_of_discarded(combination):
+                    extendable.append(positions)
+                    continue
+                if weight > min_weight:
+                    yield combination
+                    if self._search_is_superset_of_complete(combination):
+                        continue
+                else:
+                    deferred.append((weight, combination))
+                extendable.append(positions)
+
+        yield from self._deferred_searches(deferred)
+
+    def _deferred_searches(self, deferred):
+        """Yield the combinations in deferred, a list of (weight, combination), heaviest first, unless an earlier
+        search shows they can't find anything new"""
+        for weight, combination in sorted(deferred, reverse=True):
+            if self._search_is_superset_of_complete(combination):
+                continue
+            if self._search_is_subset_of_discarded(combination):
+                continue
+            yield combination
+
+    def _source_tokens(self):
+        """For each of the search record's tokens, the token it was derived from.  A dmetaphone token is
+        derived from the token it encodes, and other tokens from themselves"""
+        source_tokens = {}
+        for tokens in self.record.tokenised.values():
+            for t in tokens:
+                source_tokens.setdefault(t, t)
+                for misspelling in Record.get_dmetaphone_tokens(t):
+                    source_tokens.setdefault(misspelling, source_tokens[t])
+        return source_tokens
+
+    def _token_weights(self):
+        """
+        For each token in the search record, -log10 of the proportion of records that contain it.  This is
+        estimated from the token proportions if the token's document count isn't known.
+        The expected number of results of a search is num_records * 10 ** -(its weight), see _combination_weight
+        """
+        totals = self._token_count_totals()
+        num_records = self._num_records()
+
+        fractions = {}
+        for col, token_probs in self.record.token_probabilities.items():
+            for token, value in token_probs.items():
+                p = value["proportion"]
+                if p == "does_not_exist_in_db" or p is None:
+                    continue
+                if totals.get(col) and num_records:
+                    fraction = min(1, p * totals[col] / num_records)
+                else:
+                    fraction = p
+                # The same token may appear in more than one column
+                other_columns = fractions.get(token, 0)
+                fractions[token] = 1 - (1 - other_columns) * (1 - fraction)
+
+        # Where possible use the exact number of records that contain each token
+        if num_records:
+            for token, doc_count in self._token_doc_counts().items():
+                if token in fractions:
+                    fractions[token] = min(1, doc_count / num_records)
+
+        return {t: -log10(f) for t, f in fractions.items() if f > 0}
+
+    def _results_without_searching(self, tokens):
+        """
+        If the number of records that contain each token shows that a search would find nothing, or return
+        so many results that they would be discarded, return its results without running it.
+
+        At least sum(doc counts) - (number of tokens - 1) * num_records records contain all the tokens
+        """
+        doc_counts = self._token_doc_counts()
+        known_counts = [doc_counts[t] for t in tokens if t in doc_counts]
+        if not known_counts:
+            return None
+
+        if min(known_counts) == 0:
+            self._add_complete_search(tokens)
+            return {"num_new_recs_found": 0, "num_results": 0, "skipped": True}
+
+        if self.individual_search_limit < self.return_records_limit:
+            # Results are never discarded
+            return None
+
+        overlap = (len(tokens) - 1) * self._num_records()
+        min_results = sum(known_counts) - overlap
+        if min_results >= self.return_records_limit:
+            self._discarded_searches.append(frozenset(tokens))
+            num_results = min(min_results, self.individual_search_limit)
+            return {
+                "num_new_recs_found": 0,
+                "num_results": num_results,
+                "skipped": True,
+            }
+
+        return None
+
+    def _token_doc_counts(self):
+        """
+        The number of records whose concat_all contains each token of the search record, from the
+        fts5vocab table created by connections.create_fts_vocab_table.  Tokens that FTS would split into
+        several terms are left out
+        """
+        if self._doc_counts is None:
+            self._doc_counts = {}
+            tokens = set(
+                chain.from_iterable(
+                    self.record.tokenised_including_mispellings.values()
+                )
+            )
+            terms = {t.lower(): t for t in tokens if _FTS_TERM.fullmatch(t.lower())}
+            if not terms:
+                return self._doc_counts
+
+            placeholders = ", ".join("?" for _ in terms)
+            sql = f"""
+            SELECT term, doc
+            FROM temp.fts_target_vocab
+            WHERE col = 'concat_all' AND term IN ({placeholders})
+            """
+            c = self.conn.cursor()
+            try:
+                c.execute(sql, list(terms))
+            except sqlite3.OperationalError:
+                # This connection doesn't have the vocab table
+                c.close()
+                return self._doc_counts
+            counts = {r["term"]: r["doc"] for r in c.fetchall()}
+            c.close()
+            self._doc_counts = {t: counts.get(term, 0) for term, t in terms.items()}
+        return self._doc_counts
+
+    def _token_count_totals(self):
+        c = self.conn.cursor()
+        try:
+            c.execute("SELECT column_name, total_token_count FROM token_count_totals")
+        except sqlite3.OperationalError:
+            # Databases created by earlier versions of fuzzyfinder don't store totals
+            c.close()
+            return {}
+        totals = {r["column_name"]: r["total_token_count"] for r in c.fetchall()}
+        c.close()
+        return totals
+
+    def _num_records(self):
+        if self._record_count is None:
+            c = self.conn.cursor()
+            c.execute("SELECT max(rowid) as num_records FROM df")
+            self._record_count = c.fetchone()["num_records"] or 0
+            c.close()
+        return self._record_count
+
+    def _search_is_superset_of_complete(self, tokens):
+        # A search for a superset of tokens that were all found can't find anything new
+        tokens = frozenset(tokens)
+        for complete in self._complete_searches:
+            if complete <= tokens:
+                return True
+        return False
+
+    def _search_is_subset_of_discarded(self, tokens):
+        # A search for a subset of tokens that returned too many results will also return too many
+        tokens = frozenset(tokens)
+        for discarded in self._discarded_searches:
+            if tokens <= discarded:
+                return True
+        return False
+
+
+def _combination_weight(positions, weights, sources):
+    """
+    The weight of a combination of tokens, given as positions in weights.  A record that contains a token
+    nearly always contains its dmetaphone tokens too, so the tokens derived from the same token only count
+    once, with the weight of the heaviest of them
+    """
+    source_weights = {}
+    for i in positions:
+        source_weights[sources[i]] = max(source_weights.get(sources[i], 0), weights[i])
+    return sum(source_weights.values())
+
+
+def _max_weight_avoiding(weights, forbidden_sets, max_nodes=20_000):
+    """
+    The greatest total weight of a set of keys of weights that has none of forbidden_sets as a subset, found
+    by a branch and bound search.  Returns None if the search would visit more than max_nodes sets
+    """
+    keys = sorted(weights, key=weights.get, reverse=True)
+    remaining = [0] * (len(keys) + 1)
+    for i in range(len(keys) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + weights[keys[i]]
+
+    forbidden_by_key = {k: [] for k in keys}
+    for s in forbidden_sets:
+        for k in s:
+            if k in forbidden_by_key:
+                forbidden_by_key[k].append(s)
+
+    best = 0
+    nodes = 0
+    stack = [(0, frozenset(), 0)]
+    while stack:
+        i, chosen, weight = stack.pop()
+        nodes += 1
+        if nodes > max_nodes:
+            return None
+        if weight + remaining[i] <= best:
+            continue
+        if i == len(keys):
+            best = weight
+            continue
+        key = keys[i]
+        stack.append((i + 1, chosen, weight))
+        with_key = chosen | {key}
+        if not any(s <= with_key for s in forbidden_by_key[key]):
+            stack.append((i + 1, with_key, weight + weights[key]))
+    return best
+
+
+def _disjoint_min_weight(weights, sets):
+    """
+    A lower bound on the weight of any set of keys that intersects all of sets: the sum over disjoint sets of
+    their least weighty key
+    """
+    min_weights = [(min(weights.get(k, 0) for k in s), s) for s in sets]
+    min_weights.sort(key=lambda x: x[0], reverse=True)
+
+    total = 0
+    used = set()
+    for weight, s in min_weights:
+        if used.isdisjoint(s):
+            total += weight
+            used.update(s)
+    return total
@@ -29,6 +29,8 @@ class Record:
         sqlite_db_conn: sqlite3.Connection = None,
         cols_to_ignore: list = [],
         dmeta_cols: list = None,
+        token_stats: dict = None,
+        token_proportion_cache=None,
     ):
         """
         Args:
@@ -37,6 +39,10 @@ class Record:
             cols_to_ignore (list): List of columns that should be ignored when populating the FTS search database
             dmeta_cols (list): List of columns to create dmetaphone token variants for
             sqlite_db_conn (sqlie3.Connection):  A connection to a sqlite database that contains column statistics
+            token_stats (dict, optional): A token stats snapshot for each column, used instead of the database
+                to look up token proportions.  See SearchDatabase.token_stats
+            token_proportion_cache (TokenProportionCache, optional): The cache of token proportions looked up
+                from sqlite_db_conn's database.  Defaults to None, meaning token proportions are not cached
 
         """
 
@@ -46,6 +52,10 @@ class Record:
 
         self.cols_to_ignore = cols_to_ignore
         self.dmeta_cols = dmeta_cols
+        self.token_stats = token_stats
+        self.token_proportion_cache = token_proportion_cache
+
+        self._token_probabilities = None
 
         if self.unique_id_col not in self.record_dict:
             raise KeyError(
@@ -77,37 +87,50 @@ class Record:
     @staticmethod
     @lru_cache(maxsize=int(1e6))
     def tokenise_value(value):
+        value = _value_to_string(value)
         if value is None:
             return []
+        return _clean_string(value).split(" ")
 
-        if type(value) == float:
-            if math.isnan(value):
-                value = ""
-            else:
-                value = f"{value:.4g}".replace(".", "")
-                value = re.sub(r"e\+\d{1,4}", "", value)
-        else:
-            value = str(value)
-
-        if value.strip() == "":
-            return []
-
-        value = value.upper()
+    @staticmethod
+    def tokenise_column(values):
+        """Tokenise a whole column of values at once, with exactly the same result as calling
+        tokenise_value on each value.
 
-        value = re.sub(r"\s{2,100}", " ", value)  # Multiple spaces become a space
-        value = re.sub(r"[^\w\s]", " ", value)  # Any punctuation becomes a space
+        Each distinct value is only tokenised once, and rather than running each regex once per value, the
+        distinct values are joined into a single string and each regex is run once over the whole column.
 
-        # Tokenise long words at boundary between char and num
-        value = re.sub(r"(?=[A-Z]{3,}\d{2,})([A-Z]+)(\d+)", r"\1 \2", value)
-        value = re.sub(r"(?=\d{3,}[A-Z]{2,})(\d+)([A-Z]+)", r"\1 \2", value)
+        Args:
+            values (list, numpy array or pandas Series): The values in the column
 
-        # Bad idea?  Split up really long words
-        value = re.sub(r"(\w{4})(\w{4})(\w{4})", r"\1\2 \3", value)
-        value = re.sub(r"\s{2,100}", " ", value)
+        Returns:
+            list: A list of token lists, one per value
+        """
+        if hasattr(values, "tolist"):
+            values = values.tolist()
+
+        # Key on type as well as value so that e.g. 1, 1.0 and True are tokenised separately
+        keys = [(type(v), v) for v in values]
+        distinct = {}
+        for key in keys:
+            if key not in distinct:
+                distinct[key] = _value_to_string(key[1])
+
+        strings = [s for s in distinct.values() if s is not None]
+        if any(_COLUMN_SEPARATOR in s for s in strings):
+            cleaned = [_clean_string(s) for s in strings]
+        else:
+            # The separator is neither a word nor a whitespace character, so none of the regexes can match
+            # across it and each value is cleaned exactly as if it was on its own
+            joined = _clean_string(_COLUMN_SEPARATOR.join(strings), _COLUMN_SEPARATOR)
+            cleaned = [s.strip() for s in joined.split(_COLUMN_SEPARATOR)]
 
-        value = value.strip()
+        cleaned = iter(cleaned)
+        tokens = {}
+        for key, s in distinct.items():
+            tokens[key] = [] if s is None else next(cleaned).split(" ")
 
-        return value.split(" ")
+        return [tokens[key] for key in keys]
 
     @property
     def tokenised(self):
@@ -177,21 +200,23 @@ class Record:
         return " ".join(all_tokens)
 
     @property
-    @lru_cache(maxsize=int(1e6))
     def token_probabilities(self):
+        """The proportion of tokens in each column that are each of this record's tokens, looked up with one
+        query per column the first time they're needed"""
+        if self._token_probabilities is None:
+            tfdp = {}
+            for col, tokens in self.tokenised_including_mispellings.items():
+                proportions = get_token_proportions(
+                    tokens,
+                    col,
+                    self.conn,
+                    self.token_stats,
+                    self.token_proportion_cache,
+                )
+                tfdp[col] = {token: proportions[token] for token in tokens}
+            self._token_probabilities = tfdp
 
-        tfd = self.tokenised_including_mispellings
-
-        tfdp = {}
-
-        tokens = []
-        for col, tokens in tfd.items():
-            tfdp[col] = {}
-            for token in tokens:
-                value = get_token_proportion(token, col, self.conn)
-                tfdp[col][token] = value
-
-        return tfdp
+        return self._token_probabilities
 
     @property
     def tokens_in_order_of_rarity(self):
@@ -211,23 +236,132 @@ class Record:
         return f"Record: {self.record_dict.__repr__()}."
 
 
-@lru_cache(maxsize=int(1e6))
-def get_token_proportion(token, column, conn):
-    c = conn.cursor()
-    sql = f"""
-    select token_proportion
-    from {column}_token_counts
-    where token = "{token}"
-    """
+_COLUMN_SEPARATOR = "\x00"
+
+_MULTIPLE_SPACES = re.compile(r"\s{2,100}")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_PUNCTUATION_EXCEPT_SEPARATOR = re.compile(r"[^\w\s%s]" % _COLUMN_SEPARATOR)
+_CHARS_THEN_NUMS = re.compile(r"(?=[A-Z]{3,}\d{2,})([A-Z]+)(\d+)")
+_NUMS_THEN_CHARS = re.compile(r"(?=\d{3,}[A-Z]{2,})(\d+)([A-Z]+)")
+_LONG_WORDS = re.compile(r"(\w{4})(\w{4})(\w{4})")
+_FLOAT_EXPONENT = re.compile(r"e\+\d{1,4}")
 
-    c.execute(sql)
-    d = c.fetchone()
-    c.close()
 
-    if not d:
-        # If the token NEVER appears in the search database, 'deprioritise' it in searches
-        value = {"token": token, "proportion": "does_not_exist_in_db"}
+def _value_to_string(value):
+    """Convert a value to the string that will be tokenised, or None if the value has no tokens"""
+    if value is None:
+        return None
+
+    if type(value) == float:
+        if math.isnan(value):
+            value = ""
+        else:
+            value = f"{value:.4g}".replace(".", "")
+            value = _FLOAT_EXPONENT.sub("", value)
     else:
-        value = {"token": token, "proportion": d["token_proportion"]}
+        value = str(value)
+
+    if value.strip() == "":
+        return None
 
     return value
+
+
+def _clean_string(value, separator=None):
+    value = value.upper()
+
+    value = _MULTIPLE_SPACES.sub(" ", value)  # Multiple spaces become a space
+    # Any punctuation becomes a space
+    if separator:
+        value = _PUNCTUATION_EXCEPT_SEPARATOR.sub(" ", value)
+    else:
+        value = _PUNCTUATION.sub(" ", value)
+
+    # Tokenise long words at boundary between char and num
+    value = _CHARS_THEN_NUMS.sub(r"\1 \2", value)
+    value = _NUMS_THEN_CHARS.sub(r"\1 \2", value)
+
+    # Bad idea?  Split up really long words
+    value = _LONG_WORDS.sub(r"\1\2 \3", value)
+    value = _MULTIPLE_SPACES.sub(" ", value)
+
+    return value.strip()
+
+
+def get_token_proportion(token, column, conn):
+    return get_token_proportions([token], column, conn)[token]
+
+
+# Stay well below SQLite's limit on the number of parameters in a statement
+_MAX_SQL_PARAMETERS = 900
+
+
+def get_token_proportions(tokens, column, conn, token_stats=None, cache=None):
+    """Look up the proportion of tokens in a column that are each of tokens.  Tokens that aren't in cache are
+    fetched with a single query
+
+    Args:
+        tokens (list): The tokens to look up.  May contain duplicates
+        column (str): The column name
+        conn (sqlite3.Connection): A connection to the database that contains the column statistics
+        token_stats (dict, optional): A token stats snapshot for each column.  If there is one for column, it's
+            used instead of the database.  Defaults to None
+        cache (TokenProportionCache, optional): Token proportions already looked up from conn's database.
+            Defaults to None
+
+    Returns:
+        dict: A dictionary keyed by token of {"token": token, "proportion": proportion}, where proportion is
+            "does_not_exist_in_db" if the token never appears in the column
+    """
+    if token_stats and column in token_stats:
+        return _token_proportions_from_snapshot(tokens, token_stats[column])
+
+    values = {}
+    missing = []
+    for token in dict.fromkeys(tokens):
+        value = None if cache is None else cache.get((token, column))
+        if value is None:
+            missing.append(token)
+        else:
+            values[token] = value
+
+    if not missing:
+        return values
+
+    found = {}
+    c = conn.cursor()
+    for start in range(0, len(missing), _MAX_SQL_PARAMETERS):
+        chunk = missing[start : start + _MAX_SQL_PARAMETERS]
+        placeholders = ", ".join("?" * len(chunk))
+        sql = f"""
+        select token, token_proportion
+        from {column}_token_counts
+        where token in ({placeholders})
+        """
+        c.execute(sql, chunk)
+        for d in c.fetchall():
+            found[d["token"]] = d["token_proportion"]
+    c.close()
+
+    for token in missing:
+        if token in found:
+            value = {"token": token, "proportion": found[token]}
+        else:
+            # If the token NEVER appears in the search database, 'deprioritise' it in searches
+            value = {"token": token, "proportion": "does_not_exist_in_db"}
+        if cache is not None:
+            cache.put((token, column), value)
+        values[token] = value
+
+    return values
+
+
+def _token_proportions_from_snapshot(tokens, stats):
+    values = {}
+    for token in tokens:
+        if token not in values:
+            proportion = stats.get(token)
+            if proportion is None:
+                proportion = "does_not_exist_in_db"
+            values[token] = {"token": token, "proportion": proportion}
+    return values
@@ -0,0 +1,153 @@
+from array import array
+from bisect import bisect_left
+import mmap
+import os
+import struct
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# File layout, in native byte order:
+#   header: magic, format version, stats version (32 ascii characters), number of tokens n
+#   n + 1 uint64 offsets of the start of each token in the string table, the last being its length
+#   n float64 token proportions, in token order
+#   the string table: the utf-8 encoded tokens, sorted by their bytes and concatenated
+_MAGIC = b"FFTS"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("=4sI32sQ")
+
+
+def token_stats_path(db_filename, column):
+    """The path of the token stats snapshot for a column of the database in db_filename"""
+    return os.path.join(os.path.abspath(db_filename) + ".token_stats", f"{column}.bin")
+
+
+def write_token_stats(conn, column, path, version):
+    """
+    Write a snapshot of the token proportions in {column}_token_counts to path.  The file is written to a
+    temporary file and then moved into place, so processes that already have the old file open are unaffected
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database
+        column (str): The column name
+        path (str): Where to write the snapshot
+        version (str): A string of up to 32 ascii characters identifying the state of the token counts
+
+    Returns:
+        int: The number of tokens written
+    """
+    rows = conn.execute(
+        f"select token, token_proportion from {column}_token_counts"
+    ).fetchall()
+    entries = sorted(
+        (str(r["token"]).encode("utf-8"), r["token_proportion"] or 0.0) for r in rows
+    )
+
+    offsets = array("Q", [0])
+    proportions = array("d")
+    for token, proportion in entries:
+        offsets.append(offsets[-1] + len(token))
+        proportions.append(proportion)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(
+            _HEADER.pack(_MAGIC, _FORMAT_VERSION, version.encode("ascii"), len(entries))
+        )
+        f.write(offsets.tobytes())
+        f.write(proportions.tobytes())
+        f.write(b"".join(token for token, _ in entries))
+    os.replace(tmp_path, path)
+
+    return len(entries)
+
+
+class TokenStats:
+    """
+    A read only, memory-mapped snapshot of the token proportions of one column, written by write_token_stats.
+    Lookups are a binary search of the sorted tokens, with no SQL.  The file is shared between processes
+    through the operating system's page cache, so opening it needs no warm-up
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of a snapshot written by write_token_stats
+
+        Raises:
+            ValueError: If the file is not a token stats snapshot written by this version of fuzzyfinder
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < _HEADER.size:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a token stats file")
+        magic, format_version, version, n = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a token stats file")
+
+        self.version = version.decode("ascii").rstrip("\x00")
+        self._n = n
+
+        view = memoryview(self._mmap)
+        offsets_start = _HEADER.size
+        proportions_start = offsets_start + 8 * (n + 1)
+        self._strings_start = proportions_start + 8 * n
+        self._offsets = view[offsets_start:proportions_start].cast("Q")
+        self._proportions = view[proportions_start : self._strings_start].cast("d")
+        self._view = view
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        """The i'th token in sorted order, as utf-8 encoded bytes"""
+        start = self._strings_start + self._offsets[i]
+        end = self._strings_start + self._offsets[i + 1]
+        return self._mmap[start:end]
+
+    def get(self, token):
+        """The proportion of tokens in the column that are token, or None if it doesn't appear"""
+        key = token.encode("utf-8")
+        i = bisect_left(self, key)
+        if i < self._n and self[i] == key:
+            return self._proportions[i]
+        return None
+
+    def close(self):
+        self._offsets.release()
+        self._proportions.release()
+        self._view.release()
+        self._mmap.close()
+
+
+def open_token_stats(db_filename, columns, version):
+    """
+    Open the token stats snapshots of columns, if they exist and match version
+
+    Returns:
+        dict: A TokenStats for each column, or an empty dict if any snapshot is missing or out of date
+    """
+    token_stats = {}
+    for column in columns:
+        path = token_stats_path(db_filename, column)
+        try:
+            stats = TokenStats(path)
+        except (OSError, ValueError):
+            logger.debug(f"No usable token stats snapshot at {path}")
+            break
+        token_stats[column] = stats
+        if stats.version != version:
+            logger.debug(f"Token stats snapshot at {path} is out of date")
+            break
+    else:
+        return token_stats
+
+    for stats in token_stats.values():
+        stats.close()
+    return {}
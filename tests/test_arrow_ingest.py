@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+import pandas as pd
+
+from fuzzyfinder.database import SearchDatabase
+
+cwd = os.path.dirname(os.path.abspath(__file__))
+
+
+def _table_contents(db):
+    df_rows = db.conn.execute(
+        "select unique_id, concat_all from df order by unique_id"
+    ).fetchall()
+    token_counts = db.conn.execute(
+        "select token, token_count from surname_token_counts order by token"
+    ).fetchall()
+    return df_rows, token_counts
+
+
+def test_write_parquet_matches_pandas():
+
+    path = os.path.join(cwd, "data", "fake_30000.parquet")
+    df = pd.read_parquet(path).head(3_000)
+    df = df.reset_index()
+    df = df.drop("group", axis=1)
+
+    parquet_path = tempfile.NamedTemporaryFile(suffix=".parquet").name
+    df.to_parquet(parquet_path, index=False)
+
+    db_pandas = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db_pandas.write_pandas_dataframe(df, "index", batch_size=700)
+
+    db_arrow = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db_arrow.write_parquet(parquet_path, "index", batch_size=700)
+
+    assert _table_contents(db_pandas) == _table_contents(db_arrow)
+
+    sql = "select count(*) as c from fts_target"
+    r = db_arrow.conn.execute(sql).fetchall()
+    assert r[0]["c"] == 3_000
+
+    # Writing the same ids again should not change anything
+    db_arrow.write_parquet(parquet_path, "index", batch_size=1_000)
+    assert _table_contents(db_pandas) == _table_contents(db_arrow)
+
+
+def test_write_parquet_reads_each_row_group():
+
+    path = os.path.join(cwd, "data", "fake_30000.parquet")
+    df = pd.read_parquet(path).head(2_500)
+    df = df.reset_index()
+    df = df.drop("group", axis=1)
+
+    # Row groups that don't line up with the batches
+    parquet_path = tempfile.NamedTemporaryFile(suffix=".parquet").name
+    df.to_parquet(parquet_path, index=False, row_group_size=900)
+
+    db_pandas = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db_pandas.write_pandas_dataframe(df, "index", batch_size=400)
+
+    db_arrow = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db_arrow.write_parquet(parquet_path, "index", batch_size=400)
+
+    assert _table_contents(db_pandas) == _table_contents(db_arrow)
+    assert db_arrow.last_write_stats["batches_written"] == 8
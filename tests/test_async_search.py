@@ -0,0 +1,112 @@
+import asyncio
+import tempfile
+import threading
+
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.finder import MatchFinder
+
+
+def _write_records(db):
+    first_names = ["robin", "david", "john", "sarah", "emma"]
+    surnames = ["linacre", "smith", "jones", "taylor"]
+    records = [
+        {
+            "unique_id": f"async_{i}",
+            "first_name": first_names[i % 5],
+            "surname": surnames[i % 4],
+        }
+        for i in range(60)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+
+
+def _run(coroutine):
+    # asyncio.run needs Python 3.7+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_gather_async_searches():
+
+    search_dicts = [
+        {"first_name": "robin", "surname": "smith"},
+        {"first_name": "david", "surname": "jones"},
+        {"first_name": "emma", "surname": "linacre"},
+    ]
+
+    for db_filename in [tempfile.NamedTemporaryFile().name, None]:
+        db = SearchDatabase(db_filename)
+        _write_records(db)
+
+        expected = [set(db.find_potental_matches(dict(s))) for s in search_dicts]
+
+        async def search_all():
+            searches = [db.find_potential_matches_async(dict(s)) for s in search_dicts]
+            return await asyncio.gather(*searches)
+
+        results = _run(search_all())
+        assert [set(r) for r in results] == expected
+
+        async def search_pandas():
+            return await db.find_potential_matches_as_pandas_async(search_dicts[0])
+
+        df = _run(search_pandas())
+        assert set(df["unique_id"]) == expected[0]
+
+        db.close()
+
+
+def test_cancelled_search_runs_no_more_queries(monkeypatch):
+
+    db = SearchDatabase()
+    _write_records(db)
+    search_dict = {"first_name": "robin", "surname": "smith"}
+
+    cancel_event = threading.Event()
+    cancel_event.set()
+    finder = MatchFinder(dict(search_dict), db, cancel_event=cancel_event)
+    finder.find_potential_matches()
+    assert finder.number_of_searches == 0
+    assert finder.found_records == {}
+
+    finder = MatchFinder(dict(search_dict), db)
+    finder.find_potential_matches()
+    assert finder.number_of_searches > 1
+
+    # Hold the async search after its first query until the task has been cancelled
+    finders = []
+    first_query_run = threading.Event()
+    cancelled = threading.Event()
+    fts_using_tokens = MatchFinder._fts_using_tokens
+
+    def fts_using_tokens_then_wait(self, *args, **kwargs):
+        results = fts_using_tokens(self, *args, **kwargs)
+        if not finders:
+            finders.append(self)
+            first_query_run.set()
+            cancelled.wait(timeout=10)
+        return results
+
+    monkeypatch.setattr(MatchFinder, "_fts_using_tokens", fts_using_tokens_then_wait)
+
+    async def cancel_search():
+        task = asyncio.ensure_future(db.find_potential_matches_async(search_dict))
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, first_query_run.wait, 10)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        finally:
+            cancelled.set()
+        return False
+
+    assert _run(cancel_search())
+
+    # Closing the database waits for the search's thread to finish
+    db.close()
+    assert finders[0].number_of_searches == 1
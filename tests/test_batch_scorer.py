@@ -0,0 +1,58 @@
+import pytest
+
+import fuzzyfinder.comparison as comparison
+from fuzzyfinder.comparison import BatchRecordScorer, RecordComparisonScorer
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.record import Record
+
+
+def _records():
+    first_names = ["robin", "robyn", "david", "john", "sarah"]
+    surnames = ["linacre", "linaker", "smith", "jones"]
+    return [
+        {
+            "unique_id": f"batch_{i}",
+            "first_name": first_names[i % 5],
+            "surname": surnames[i % 4],
+            "city": None if i % 7 == 0 else f"city{i % 3}",
+        }
+        for i in range(60)
+    ]
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_batch_scores_match_pairwise_scores(monkeypatch, use_numpy):
+
+    if not use_numpy:
+        monkeypatch.setattr(comparison, "np", None)
+
+    db = SearchDatabase()
+    records = _records()
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+
+    search_rec = Record(
+        {
+            "unique_id": "batch_search",
+            "first_name": "robin",
+            "surname": "linacre zzzz",
+            "city": "city1",
+        },
+        "unique_id",
+        db.conn,
+    )
+    potential_match_recs = [Record(r, "unique_id", db.conn) for r in records]
+
+    scores = BatchRecordScorer(search_rec).scores(potential_match_recs)
+    for rec, score in zip(potential_match_recs, scores):
+        expected = RecordComparisonScorer(search_rec, rec).score
+        assert score == pytest.approx(expected, abs=1e-12)
+
+    # Potential matches whose probabilities could overflow are scored by RecordComparisonScorer
+    monkeypatch.setattr(comparison, "_MAX_LOG_PROBABILITY", 0)
+    exact_scores = BatchRecordScorer(search_rec).scores(potential_match_recs)
+    for rec, score in zip(potential_match_recs, exact_scores):
+        assert score == RecordComparisonScorer(search_rec, rec).score
+
+    assert BatchRecordScorer(search_rec).scores([]) == []
+
+    db.close()
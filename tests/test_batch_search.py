@@ -0,0 +1,81 @@
+import tempfile
+
+import pandas as pd
+import pytest
+
+from fuzzyfinder.database import SearchDatabase
+
+
+def test_find_matches_batch():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename)
+
+    records = [
+        {"unique_id": 1, "first_name": "robin", "surname": "linacre"},
+        {"unique_id": 2, "first_name": "robyn", "surname": "linaker"},
+        {"unique_id": 3, "first_name": "david", "surname": "smith"},
+        {"unique_id": 4, "first_name": "david", "surname": "jones"},
+        {"unique_id": 5, "first_name": "john", "surname": "smith"},
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+
+    searches = pd.DataFrame(
+        [
+            {"unique_id": "a", "first_name": "robin", "surname": "linacre"},
+            {"unique_id": "b", "first_name": "david", "surname": "smith"},
+            {"unique_id": "c", "first_name": "zzz", "surname": "yyy"},
+        ]
+    )
+
+    df = db.find_matches_batch_as_pandas(searches, chunk_size=2, processes=2)
+    assert list(df.columns) == [
+        "search_id",
+        "candidate_id",
+        "score",
+        "bm25_score",
+        "search_budget_exhausted",
+    ]
+    assert set(df["search_id"]) == {"a", "b"}
+    assert not df["search_budget_exhausted"].any()
+
+    # The results match searching for each record one at a time
+    for search_dict in searches.to_dict(orient="records"):
+        search_id = search_dict["unique_id"]
+        expected_ids = set(db.find_potental_matches(search_dict).keys())
+        batch = df[df["search_id"] == search_id]
+        assert set(batch["candidate_id"]) == expected_ids
+        assert list(batch["score"]) == sorted(batch["score"], reverse=True)
+
+    best = df[df["search_id"] == "b"].iloc[0]
+    assert best["candidate_id"] == 3
+
+    # Search records without an id are identified by their position
+    results = db.find_matches_batch(
+        [{"first_name": "john"}, {"surname": "jones"}], processes=1
+    )
+    assert {r["search_id"] for r in results} == {0, 1}
+
+    results = db.find_matches_batch(
+        [{"first_name": "david", "surname": "smith"}], processes=1, max_queries=1
+    )
+    assert len(results) > 0
+    assert all(r["search_budget_exhausted"] for r in results)
+
+    # The workers' connections are read only
+    read_only_db = SearchDatabase(db_filename, read_only=True)
+    assert read_only_db.unique_id_col == "unique_id"
+    with pytest.raises(Exception):
+        read_only_db.write_list_dicts_parallel(
+            [{"unique_id": 6, "first_name": "x", "surname": "y"}], "unique_id"
+        )
+    read_only_db.close()
+
+
+def test_find_matches_batch_in_memory():
+    db = SearchDatabase()
+    db.write_list_dicts_parallel(
+        [{"unique_id": 1, "first_name": "robin"}], unique_id_col="unique_id"
+    )
+    with pytest.raises(ValueError):
+        db.find_matches_batch([{"first_name": "robin"}])
@@ -23,6 +23,8 @@ def test_build_and_search():
     search_rec = {"unique_id": 4, "first_name": "robin", "surname": None}
 
     assert 1 in db.find_potental_matches(search_rec).keys()
+    # The search record isn't modified
+    assert search_rec["unique_id"] == 4
 
     # With record caching, we want to make sure that if the search rec is changed but the unique id
     # is for some reason left the same, we get different search results
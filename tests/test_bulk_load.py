@@ -0,0 +1,111 @@
+import tempfile
+
+import pytest
+
+from fuzzyfinder.database import SearchDatabase
+
+
+def _database_contents(db):
+    df_rows = db.conn.execute("select * from df order by unique_id").fetchall()
+    fts_rows = db.conn.execute(
+        "select unique_id, concat_all from fts_target order by unique_id"
+    ).fetchall()
+    token_counts = db.conn.execute(
+        "select token, token_count from surname_token_counts order by token"
+    ).fetchall()
+    return df_rows, fts_rows, token_counts
+
+
+def test_bulk_load_matches_normal_build():
+
+    records_1 = []
+    for i in range(40):
+        records_1.append(
+            {"unique_id": i, "first_name": "robin", "surname": f"s{i % 4}"}
+        )
+
+    # Includes some unique_ids that already appear in records_1, with different values
+    records_2 = []
+    for i in range(30, 50):
+        records_2.append({"unique_id": i, "first_name": "john", "surname": "smith"})
+
+    db_normal = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db_normal.write_list_dicts_parallel(records_1, "unique_id", batch_size=7)
+    db_normal.write_list_dicts_parallel(records_2, "unique_id", batch_size=7)
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db_bulk = SearchDatabase(db_filename)
+    with db_bulk.bulk_load():
+        db_bulk.write_list_dicts_parallel(records_1, "unique_id", batch_size=7)
+
+        # Until the load is finished, reopening the database warns
+        with pytest.warns(UserWarning):
+            SearchDatabase(db_filename)
+
+        db_bulk.write_list_dicts_parallel(records_2, "unique_id", batch_size=7)
+
+    assert not db_bulk.bulk_loading
+    assert _database_contents(db_normal) == _database_contents(db_bulk)
+
+    db_normal.build_or_replace_stats_tables()
+    db_bulk.build_or_replace_stats_tables()
+    search_rec = {"first_name": "john", "surname": "smith"}
+    normal_matches = db_normal.find_potental_matches(search_rec)
+    bulk_matches = db_bulk.find_potental_matches(search_rec)
+    assert normal_matches.keys() == bulk_matches.keys()
+
+    # Bulk loading is only for new databases
+    with pytest.raises(ValueError):
+        db_bulk.begin_bulk_load()
+
+
+def test_reopen_bulk_load_before_any_records_written():
+
+    records = [
+        {"unique_id": i, "first_name": "robin", "surname": f"s{i}"} for i in range(10)
+    ]
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename)
+    db.begin_bulk_load()
+    db.close()
+
+    with pytest.warns(UserWarning):
+        db = SearchDatabase(db_filename)
+    assert db.bulk_loading
+    assert db.example_record is None
+
+    db.write_list_dicts_parallel(records, "unique_id")
+    db.finish_bulk_load()
+    db.build_or_replace_stats_tables()
+    assert 3 in db.find_potental_matches({"first_name": "robin", "surname": "s3"})
+
+
+def test_bulk_load_aborted_by_exception():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename)
+
+    with pytest.raises(RuntimeError):
+        with db.bulk_load():
+            db.write_list_dicts_parallel(
+                [{"unique_id": 1, "first_name": "robin", "surname": "linacre"}],
+                "unique_id",
+            )
+            raise RuntimeError("Load failed")
+
+    assert not db.bulk_loading
+
+    # The database is empty again, so can be loaded with records that have different columns
+    records = [{"id": i, "name": f"john s{i}"} for i in range(10)]
+    with db.bulk_load():
+        db.write_list_dicts_parallel(records, "id")
+
+    assert db.conn.execute("select count(*) as n from df").fetchone()["n"] == 10
+    db.build_or_replace_stats_tables()
+    assert 3 in db.find_potental_matches({"name": "john s3"})
+
+    db.close()
+    db = SearchDatabase(db_filename)
+    assert not db.bulk_loading
+    assert db.unique_id_col == "id"
@@ -0,0 +1,29 @@
+import pytest
+
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.finder import MatchFinder
+
+
+def test_fts_query_returns_records(monkeypatch):
+
+    db = SearchDatabase()
+    records = [
+        {"unique_id": i, "first_name": "robin", "surname": f"linacre{i % 4}"}
+        for i in range(20)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+
+    def fail(self, rec_id):
+        pytest.fail("Records should be fetched by the FTS query")
+
+    monkeypatch.setattr(MatchFinder, "get_record_dict_from_id", fail)
+
+    search_dict = {"unique_id": "search", "first_name": "robin", "surname": "linacre1"}
+    finder = MatchFinder(search_dict, db)
+    finder.find_potential_matches()
+
+    assert set(finder.found_records.keys()) >= {1, 5, 9, 13, 17}
+    for rec_id, record in finder.found_records.items():
+        assert record["unique_id"] == rec_id
+        assert record["surname"] == f"linacre{rec_id % 4}"
+        assert "score" in record and "bm25_score" in record
@@ -0,0 +1,69 @@
+import tempfile
+
+from fuzzyfinder.cache import FTSResultCache, fts_result_cache
+from fuzzyfinder.database import SearchDatabase
+
+
+def _records(start, end):
+    return [
+        {
+            "unique_id": f"cache_{i}",
+            "first_name": ["robin", "david"][i % 2],
+            "surname": ["linacre", "smith", "jones"][i % 3],
+        }
+        for i in range(start, end)
+    ]
+
+
+def test_cache_hits_and_write_invalidation():
+
+    db = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db.write_list_dicts_parallel(_records(0, 30), unique_id_col="unique_id")
+
+    search_dict = {"first_name": "robin", "surname": "smith"}
+
+    fts_result_cache.clear()
+    first = db.find_potental_matches(dict(search_dict))
+    assert fts_result_cache.stats["hits"] == 0
+    misses = fts_result_cache.stats["misses"]
+    assert misses > 0
+
+    second = db.find_potental_matches(dict(search_dict))
+    assert set(second) == set(first)
+    assert fts_result_cache.stats["hits"] == misses
+    assert fts_result_cache.stats["hit_rate"] == 0.5
+
+    # Writing new records means cached results are out of date
+    db.write_list_dicts_parallel(_records(30, 40), unique_id_col="unique_id")
+    third = db.find_potental_matches(dict(search_dict))
+    assert {"cache_31", "cache_37"} <= set(third) - set(first)
+
+    # A different database with the same records doesn't share results
+    other_db = SearchDatabase()
+    other_db.write_list_dicts_parallel(_records(0, 10), unique_id_col="unique_id")
+    assert set(other_db.find_potental_matches(dict(search_dict))) <= {
+        f"cache_{i}" for i in range(10)
+    }
+    db.close()
+
+
+def test_cache_eviction():
+
+    cache = FTSResultCache(max_entries=2)
+    cache.put(("db", frozenset(["A"]), 50), [])
+    cache.put(("db", frozenset(["B"]), 50), [])
+    assert cache.get(("db", frozenset(["A"]), 50)) == []
+    cache.put(("db", frozenset(["C"]), 50), [])
+    assert cache.get(("db", frozenset(["B"]), 50)) is None
+    assert cache.stats["entries"] == 2
+
+    row = {"unique_id": 1, "bm25_score": -1, "original_record": "x" * 1_000}
+    cache = FTSResultCache(max_bytes=3_000)
+    for token in "ABCD":
+        cache.put(("db", frozenset([token]), 50), [row])
+    assert cache.stats["entries"] == 2
+    assert cache.bytes <= 3_000
+
+    cache.invalidate("db")
+    assert cache.stats["entries"] == 0
+    assert cache.bytes == 0
@@ -0,0 +1,68 @@
+import sqlite3
+import tempfile
+
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.finder import MatchFinder
+from fuzzyfinder.utils import dict_factory
+
+
+def _database(db_filename=None):
+    db = SearchDatabase(db_filename)
+    records = [
+        {
+            "unique_id": f"vocab_{i}",
+            "first_name": "robin",
+            "surname": "smith" if i < 90 else "jones",
+        }
+        for i in range(100)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+    return db
+
+
+def test_doc_counts():
+
+    db = _database()
+    finder = MatchFinder({"first_name": "robin", "surname": "jones"}, db)
+    assert finder._token_doc_counts()["ROBIN"] == 100
+    assert finder._token_doc_counts()["JONES"] == 10
+
+
+def test_searches_skipped_using_doc_counts():
+
+    db = _database()
+    finder = MatchFinder({"first_name": "robin", "surname": "smith zzzz"}, db)
+
+    # At least 100 + 90 - 100 records contain both tokens, so the results would be discarded
+    results = finder._fts_using_tokens(("ROBIN", "SMITH"))
+    assert results["skipped"]
+    assert results["num_results"] == 50
+    assert finder.number_of_searches == 0
+    assert frozenset(["ROBIN", "SMITH"]) in finder._discarded_searches
+
+    # No records contain ZZZZ
+    results = finder._fts_using_tokens(("ROBIN", "ZZZZ"))
+    assert results["skipped"]
+    assert results["num_results"] == 0
+    assert finder.number_of_searches == 0
+
+    results = finder._fts_using_tokens(("ROBIN", "JONES"))
+    assert not results.get("skipped")
+    assert results["num_results"] == 10
+    assert finder.number_of_searches == 1
+    assert finder.number_of_skipped_searches == 2
+
+
+def test_connection_without_vocab_table():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = _database(db_filename)
+
+    conn = sqlite3.connect(db_filename)
+    conn.row_factory = dict_factory
+    finder = MatchFinder({"first_name": "robin", "surname": "jones"}, db, conn=conn)
+    assert finder._token_doc_counts() == {}
+
+    results = finder._fts_using_tokens(("ROBIN", "SMITH"))
+    assert results["num_results"] == 50
+    assert finder.number_of_searches == 1
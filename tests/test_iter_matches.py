@@ -0,0 +1,55 @@
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.finder import MatchFinder
+
+
+def _database():
+    db = SearchDatabase()
+    first_names = ["robin", "david", "john", "sarah"]
+    surnames = ["linacre", "smith", "jones", "taylor", "brown"]
+    records = [
+        {
+            "unique_id": f"iter_{i}",
+            "first_name": first_names[i % 4],
+            "surname": surnames[i % 5],
+            "city": f"city{i % 7}",
+        }
+        for i in range(200)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+    return db
+
+
+def test_iter_potential_matches():
+
+    db = _database()
+    search_dict = {
+        "unique_id": "iter_search",
+        "first_name": "robin",
+        "surname": "linacre",
+        "city": "city3",
+    }
+
+    finder = MatchFinder(dict(search_dict), db)
+    finder.find_potential_matches()
+
+    iter_finder = MatchFinder(dict(search_dict), db)
+    records = list(iter_finder.iter_potential_matches())
+
+    # The same records are found, each yielded once with its score
+    assert len(records) == len(finder.found_records)
+    assert {r["unique_id"] for r in records} == set(finder.found_records)
+    for r in records:
+        assert r["score"] == finder.found_records[r["unique_id"]]["score"]
+
+    # The consumer can stop the search early
+    early_finder = MatchFinder(dict(search_dict), db)
+    matches = early_finder.iter_potential_matches()
+    first = next(matches)
+    matches.close()
+    assert first["unique_id"] in early_finder.found_records
+    assert early_finder.number_of_searches < finder.number_of_searches
+
+    db_records = list(db.iter_potential_matches(search_dict))
+    assert len(db_records) == len(records)
+
+    db.close()
@@ -0,0 +1,28 @@
+from itertools import product
+
+from fuzzyfinder.comparison import MISSPELLING_RATIO, is_misspelling, leven_ratio
+
+
+def test_is_misspelling_matches_leven_ratio():
+
+    tokens = [
+        "ROBIN",
+        "ROBYN",
+        "ROBBIN",
+        "RBN",
+        "LINACRE",
+        "LINACER",
+        "LINAKER",
+        "NILACRE",
+        "SMITH",
+        "SMYTHE",
+        "A",
+        "AB",
+        "10",
+        "100",
+    ]
+    for a, b in product(tokens, tokens):
+        assert is_misspelling(a, b) == (leven_ratio(a, b) > MISSPELLING_RATIO)
+
+    assert is_misspelling("ROBIN", "ROBYN")
+    assert not is_misspelling("ROBIN", "RBN")
@@ -0,0 +1,88 @@
+import tempfile
+
+from fuzzyfinder.database import SearchDatabase
+
+
+def _token_counts(db, col):
+    sql = f"select token, token_count from {col}_token_counts order by token"
+    return db.conn.execute(sql).fetchall()
+
+
+def test_overlapping_writes_count_only_inserted_records():
+
+    kwargs = {"cols_to_ignore": ["email"], "dmeta_cols": ["surname"]}
+
+    records = []
+    for i in range(30):
+        records.append(
+            {
+                "unique_id": i,
+                "first_name": f"robin{i % 3}",
+                "surname": "linacre" if i % 2 else "smith",
+                "email": f"r{i}@x.com",
+            }
+        )
+
+    db_expected = SearchDatabase(tempfile.NamedTemporaryFile().name, **kwargs)
+    db_expected.write_list_dicts_parallel(records, "unique_id", batch_size=7)
+
+    db = SearchDatabase(tempfile.NamedTemporaryFile().name, **kwargs)
+    db.write_list_dicts_parallel(records[:20], "unique_id", batch_size=7)
+
+    # Mostly overlapping, with a duplicate within a batch, and one batch where records
+    # don't all have the same keys
+    overlapping = records[5:] + [dict(records[25], first_name="changed")]
+    overlapping[1] = {k: v for k, v in reversed(list(overlapping[1].items()))}
+    db.write_list_dicts_parallel(overlapping, "unique_id", batch_size=4)
+
+    for col in ["first_name", "surname"]:
+        assert _token_counts(db, col) == _token_counts(db_expected, col)
+
+    sql = "select unique_id, concat_all from df order by unique_id"
+    assert db.conn.execute(sql).fetchall() == db_expected.conn.execute(sql).fetchall()
+
+    sql = "select count(*) as c from fts_target"
+    assert db.conn.execute(sql).fetchall()[0]["c"] == 30
+
+
+def test_ids_only_sqlite_sees_as_duplicates():
+
+    records = [
+        {"unique_id": 1, "first_name": "robin"},
+        {"unique_id": "1", "first_name": "david"},
+        {"unique_id": 2, "first_name": "john"},
+    ]
+
+    db = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db.write_list_dicts_parallel(records, "unique_id")
+
+    sql = "select unique_id, concat_all from df order by unique_id"
+    assert db.conn.execute(sql).fetchall() == [
+        {"unique_id": "1", "concat_all": "ROBIN RPN"},
+        {"unique_id": "2", "concat_all": "JOHN JN AN"},
+    ]
+    assert [r["token"] for r in _token_counts(db, "first_name")] == [
+        "AN",
+        "JN",
+        "JOHN",
+        "ROBIN",
+        "RPN",
+    ]
+
+
+def test_leftover_staging_tables_are_replaced():
+
+    records = [{"unique_id": i, "first_name": f"robin{i % 3}"} for i in range(10)]
+
+    db = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db.write_list_dicts_parallel(records[:5], "unique_id")
+
+    # e.g. left behind by a write that failed part way through
+    db.conn.execute("CREATE TEMP TABLE df_staging (batch_position INTEGER PRIMARY KEY)")
+    db.conn.execute("CREATE TEMP TABLE df_staging_new (batch_position INTEGER)")
+    db.conn.execute("INSERT INTO temp.df_staging_new VALUES (9)")
+
+    db.write_list_dicts_parallel(records, "unique_id")
+
+    sql = "select unique_id from df order by cast(unique_id as integer)"
+    assert [r["unique_id"] for r in db.conn.execute(sql)] == [str(i) for i in range(10)]
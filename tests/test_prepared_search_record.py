@@ -0,0 +1,36 @@
+from fuzzyfinder.comparison import RecordComparisonScorer, PreparedSearchRecord
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.record import Record
+
+
+def test_prepared_search_record_is_reused_across_candidates():
+
+    db = SearchDatabase()
+    records = [
+        {
+            "unique_id": f"prepared_{i}",
+            "first_name": ["robin", "robyn", "john"][i % 3],
+            "surname": ["linacre", "smith"][i % 2],
+        }
+        for i in range(30)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+
+    search_rec = Record(
+        {"unique_id": "prepared_search", "first_name": "robin", "surname": "linacre"},
+        "unique_id",
+        db.conn,
+    )
+    prepared = PreparedSearchRecord(search_rec)
+    assert prepared.token_sets["surname"] == set(prepared.tokens["surname"])
+
+    for record_dict in records:
+        expected = RecordComparisonScorer(
+            search_rec, Record(record_dict, "unique_id", db.conn)
+        ).score
+
+        # Scoring with a prepared search record only needs the candidate's tokens, not their proportions
+        candidate = Record(record_dict, "unique_id", sqlite_db_conn=None)
+        assert RecordComparisonScorer(search_rec, candidate, prepared).score == expected
+
+    db.close()
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+
+import pytest
+
+from fuzzyfinder.connections import ReadConnectionPool
+from fuzzyfinder.database import SearchDatabase
+
+
+def _records():
+    first_names = ["robin", "david", "john", "sarah", "emma"]
+    surnames = ["linacre", "smith", "jones", "taylor"]
+    return [
+        {
+            "unique_id": f"rec_{i}",
+            "first_name": first_names[i % 5],
+            "surname": surnames[i % 4],
+            "city": f"city{i % 7}",
+        }
+        for i in range(100)
+    ]
+
+
+def test_concurrent_searches():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename, max_read_connections=3)
+    db.write_list_dicts_parallel(_records(), unique_id_col="unique_id")
+
+    search_dicts = [
+        {"first_name": "robin", "surname": "smith"},
+        {"first_name": "david", "city": "city3"},
+        {"surname": "jones", "city": "city1"},
+    ] * 4
+
+    expected = [set(db.find_potental_matches(dict(s))) for s in search_dicts]
+
+    def search(search_dict):
+        return set(db.find_potental_matches(dict(search_dict)))
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(search, search_dicts))
+
+    assert results == expected
+    assert 1 <= db._read_pool.num_connections <= 3
+
+    db.close()
+
+
+def test_read_connections_are_read_only():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename)
+    db.write_list_dicts_parallel(_records(), unique_id_col="unique_id")
+
+    pool = ReadConnectionPool(db_filename, max_connections=1)
+    with pool.connection() as conn:
+        r = conn.execute("select count(*) as c from df").fetchone()
+        assert r["c"] == 100
+        with pytest.raises(Exception):
+            conn.execute("delete from df")
+
+    # The single connection is reused
+    with pool.connection() as conn_2:
+        assert conn_2 is conn
+    pool.close()
+
+    with pytest.raises(ValueError):
+        ReadConnectionPool(":memory:")
+
+    db.close()
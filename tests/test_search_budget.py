@@ -0,0 +1,134 @@
+import random
+
+import pytest
+
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.finder import MatchFinder
+
+
+def _database(num_records=100):
+    db = SearchDatabase()
+    records = [
+        {
+            "unique_id": f"budget_{i}",
+            "first_name": ["robin", "david", "john"][i % 3],
+            "surname": ["linacre", "smith"][i % 2],
+            "city": f"city{i % 5}",
+            "street": f"street{i % 7}",
+        }
+        for i in range(num_records)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+    return db
+
+
+def test_max_queries():
+
+    db = _database()
+    search_dict = {
+        "first_name": "robin",
+        "surname": "smith",
+        "city": "city2",
+        "street": "street6",
+    }
+
+    finder = MatchFinder(dict(search_dict), db)
+    finder.find_potential_matches()
+    assert finder.number_of_searches > 3
+    assert not finder.search_budget_exhausted
+
+    finder = MatchFinder(dict(search_dict), db, max_queries=3)
+    finder.find_potential_matches()
+    assert finder.number_of_searches == 3
+    assert finder.search_budget_exhausted
+
+    df = db.find_potential_matches_as_pandas(search_dict, max_queries=3)
+    assert df.attrs["search_budget_exhausted"]
+    assert df["search_budget_exhausted"].all()
+    assert len(df) > 0
+
+    df = db.find_potential_matches_as_pandas(search_dict)
+    assert not df.attrs["search_budget_exhausted"]
+    assert not df["search_budget_exhausted"].any()
+
+    results = db.find_potental_matches(search_dict, max_queries=3)
+    assert results.search_budget_exhausted
+    assert not db.find_potental_matches(search_dict).search_budget_exhausted
+
+    matches = db.iter_potential_matches(search_dict, max_queries=3)
+    assert len(list(matches)) == len(results)
+    assert matches.search_budget_exhausted
+
+    matches = db.iter_potential_matches(search_dict)
+    list(matches)
+    assert not matches.search_budget_exhausted
+
+
+def test_max_search_seconds():
+
+    db = _database()
+    search_dict = {"first_name": "robin", "surname": "smith", "city": "city2"}
+
+    finder = MatchFinder(dict(search_dict), db, max_search_seconds=0)
+    finder.find_potential_matches()
+    assert finder.number_of_searches == 0
+    assert finder.search_budget_exhausted
+
+    results = db.find_potental_matches(dict(search_dict), max_search_seconds=60)
+    assert len(results) > 0
+
+
+@pytest.mark.parametrize("planned_search", [False, True])
+def test_budget_reached_in_last_strategy(planned_search):
+
+    db = _database(300)
+    search_dict = {
+        "first_name": "robin",
+        "surname": "smith",
+        "city": "city2",
+        "street": "street6",
+    }
+    options = {
+        "return_records_limit": 1000,
+        "individual_search_limit": 20,
+        "planned_search": planned_search,
+    }
+
+    def run_search(**search_options):
+        random.seed(0)
+        finder = MatchFinder(dict(search_dict), db, **options, **search_options)
+        finder.find_potential_matches()
+        return finder
+
+    num_queries = run_search().number_of_searches
+    # The queries run before the last strategy
+    num_queries_before = run_search(search_intensity=0).number_of_searches
+    assert num_queries - 1 > num_queries_before
+
+    finder = run_search(max_queries=num_queries - 1)
+    assert finder.number_of_searches == num_queries - 1
+    assert finder.search_budget_exhausted
+
+
+@pytest.mark.parametrize(
+    "search_dict,seed",
+    [
+        ({"city": "city2", "street": "street6"}, 0),
+        ({"first_name": "robin", "surname": "smith", "city": "city2"}, 0),
+        ({"first_name": "robin", "surname": "smith", "city": "city2"}, 1),
+    ],
+)
+def test_budget_not_exhausted_if_no_query_is_skipped(search_dict, seed):
+
+    db = _database()
+
+    random.seed(seed)
+    finder = MatchFinder(dict(search_dict), db)
+    finder.find_potential_matches()
+    num_queries = finder.number_of_searches
+
+    random.seed(seed)
+    finder = MatchFinder(dict(search_dict), db, max_queries=num_queries)
+    finder.find_potential_matches()
+    assert finder.number_of_searches == num_queries
+    assert not finder.search_budget_exhausted
@@ -0,0 +1,116 @@
+import os
+import random
+import tempfile
+
+import pandas as pd
+
+from fuzzyfinder.cache import fts_result_cache
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.finder import MatchFinder, _combination_weight
+
+cwd = os.path.dirname(os.path.abspath(__file__))
+
+
+def _database():
+    db = SearchDatabase()
+    records = [
+        {
+            "unique_id": f"plan_{i}",
+            "first_name": ["robin", "david", "john", "sarah"][i % 4],
+            "surname": ["linacre", "smith", "jones"][i % 3],
+            "city": f"city{i % 5}",
+            "street": f"street{i % 7}",
+        }
+        for i in range(200)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+    return db
+
+
+def test_plan_searches():
+
+    db = _database()
+    finder = MatchFinder({"first_name": "robin"}, db)
+
+    weights = {"A": 1, "B": 1, "C": 2, "D": 3}
+    planned = []
+    for tokens in finder._plan_searches(weights, min_weight=2.5):
+        planned.append("".join(tokens))
+        # Pretend every record containing A and C was found
+        if planned[-1] == "AC":
+            finder._complete_searches.append(frozenset("AC"))
+
+    # AB is expected to return too many results, so is put off until the end, but may be extended.
+    # Nothing containing AC is needed once AC is complete
+    assert planned == ["CD", "BD", "AD", "BC", "AC", "BCD", "ABD", "AB"]
+
+
+def test_planned_search_is_deterministic():
+
+    db = _database()
+    search_dict = {
+        "first_name": "robin",
+        "surname": "smith",
+        "city": "city3",
+        "street": "street2",
+    }
+
+    finders = []
+    for _ in range(2):
+        # Searches are planned by default
+        finder = MatchFinder(dict(search_dict), db, individual_search_limit=20)
+        finder.find_potential_matches()
+        finders.append(finder)
+
+    assert finders[0].found_records.keys() == finders[1].found_records.keys()
+    assert finders[0].number_of_searches == finders[1].number_of_searches
+    # Searches that returned too many results aren't followed by searches for a subset of their tokens
+    for discarded in finders[0]._discarded_searches:
+        for search in finders[0]._searches:
+            assert not search < discarded or len(search) == 1
+
+
+def test_dmetaphone_tokens_counted_once():
+
+    db = _database()
+    finder = MatchFinder({"first_name": "robin", "surname": "linacre"}, db)
+
+    source_tokens = finder._source_tokens()
+    assert source_tokens["ROBIN"] == "ROBIN"
+    assert source_tokens["RPN"] == "ROBIN"
+    assert source_tokens["LNKR"] == "LINACRE"
+
+    weights = [1, 2, 3]
+    sources = ["ROBIN", "ROBIN", "LINACRE"]
+    assert _combination_weight((0, 1), weights, sources) == 2
+    assert _combination_weight((0, 1, 2), weights, sources) == 5
+
+
+def test_planned_search_recall():
+
+    # The planned search should find at least as many true matches as the random search, in fewer queries
+    df = pd.read_parquet(os.path.join(cwd, "data", "fake_30000.parquet"))
+    df = df.reset_index()
+    groups = dict(zip(df["index"], df["group"]))
+
+    db = SearchDatabase(tempfile.NamedTemporaryFile().name)
+    db.write_pandas_dataframe(df.drop("group", axis=1), "index")
+    db.build_or_replace_stats_tables()
+
+    random.seed(0)
+    true_matches = {False: 0, True: 0}
+    num_searches = {False: 0, True: 0}
+    for search_dict in df.sample(30, random_state=1).to_dict(orient="records"):
+        group = search_dict.pop("group")
+        search_dict = {k: None if pd.isna(v) else v for k, v in search_dict.items()}
+        for planned_search in (False, True):
+            fts_result_cache.clear()
+            finder = MatchFinder(dict(search_dict), db, planned_search=planned_search)
+            finder.find_potential_matches()
+            true_matches[planned_search] += sum(
+                groups[rec_id] == group for rec_id in finder.found_records
+            )
+            num_searches[planned_search] += finder.number_of_searches
+
+    assert true_matches[True] >= true_matches[False]
+    assert num_searches[True] < num_searches[False]
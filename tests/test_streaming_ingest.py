@@ -0,0 +1,52 @@
+import io
+import tempfile
+
+import pandas as pd
+
+from fuzzyfinder.database import SearchDatabase
+
+
+def test_write_generator_and_csv_chunks():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename)
+
+    def record_generator():
+        for i in range(23):
+            yield {"unique_id": i, "first_name": "robin", "surname": f"s{i % 3}"}
+
+    db.write_records_iterable(record_generator(), unique_id_col="unique_id", batch_size=5)
+
+    sql_df_count = """
+    select count(*) as count from df
+    """
+
+    results = db.conn.execute(sql_df_count).fetchall()
+    assert results[0]["count"] == 23
+
+    sql_count_robin = """
+    select token_count
+    from first_name_token_counts
+    where token = 'ROBIN'
+    """
+    results = db.conn.execute(sql_count_robin).fetchall()
+    assert results[0]["token_count"] == 23
+
+    # Write a csv in chunks, including ids that already exist in the database
+    csv = "unique_id,first_name,surname\n"
+    for i in range(20, 30):
+        csv += f"{i},robin,linacre\n"
+
+    reader = pd.read_csv(io.StringIO(csv), chunksize=4)
+    db.write_pandas_dataframe_chunks(reader, unique_id_col="unique_id", batch_size=3)
+
+    results = db.conn.execute(sql_df_count).fetchall()
+    assert results[0]["count"] == 30
+
+    results = db.conn.execute(sql_count_robin).fetchall()
+    assert results[0]["token_count"] == 30
+
+    # An empty iterable is a no-op
+    db.write_records_iterable(iter([]), unique_id_col="unique_id")
+    results = db.conn.execute(sql_df_count).fetchall()
+    assert results[0]["count"] == 30
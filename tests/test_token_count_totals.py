@@ -0,0 +1,115 @@
+import sqlite3
+import tempfile
+
+import pytest
+
+from fuzzyfinder.database import SearchDatabase
+
+
+def _proportion(db, token):
+    sql = "select token_proportion from value_token_counts where token = ?"
+    return db.conn.execute(sql, (token,)).fetchall()[0]["token_proportion"]
+
+
+def test_totals_are_maintained_incrementally():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename)
+
+    records = [{"unique_id": i, "value": "a" if i < 3 else "b"} for i in range(10)]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=4)
+
+    sql = "select * from token_count_totals"
+    assert db.conn.execute(sql).fetchall() == [
+        {"column_name": "value", "total_token_count": 10}
+    ]
+    assert _proportion(db, "A") == 0.3
+
+    # Appending records updates the totals without rewriting the other tokens
+    records = [{"unique_id": i, "value": "c"} for i in range(10, 20)]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=4)
+    assert _proportion(db, "A") == 0.15
+    assert _proportion(db, "C") == 0.5
+
+    db.rebuild_token_count_totals()
+    assert _proportion(db, "A") == 0.15
+
+
+def test_migrate_token_counts_table():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename)
+    records = [{"unique_id": i, "value": "a" if i < 3 else "b"} for i in range(10)]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=4)
+
+    # Convert to the layout used by earlier versions, where token_counts was a table
+    db.conn.executescript(
+        """
+        DROP VIEW value_token_counts;
+        DROP TABLE token_count_totals;
+        CREATE TABLE value_token_counts
+            (token text PRIMARY KEY, token_count int, token_proportion float);
+        INSERT INTO value_token_counts
+            SELECT token, token_count, NULL FROM value_token_count_values;
+        DROP TABLE value_token_count_values;
+        """
+    )
+    db.close()
+
+    db = SearchDatabase(db_filename)
+    assert _proportion(db, "A") == 0.3
+
+    records = [{"unique_id": i, "value": "a"} for i in range(10, 20)]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=4)
+    assert _proportion(db, "A") == 0.65
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_merge_token_counts_with_and_without_upsert(monkeypatch, upsert):
+
+    if not upsert:
+        # Simulate a version of sqlite that doesn't support upsert
+        def upsert_not_supported(c, col):
+            raise sqlite3.OperationalError('near "ON": syntax error')
+
+        monkeypatch.setattr(
+            SearchDatabase,
+            "_upsert_staged_token_counts",
+            staticmethod(upsert_not_supported),
+        )
+
+    db = SearchDatabase()
+    records = [{"unique_id": i, "value": "a" if i < 3 else "b"} for i in range(10)]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=4)
+    assert db.last_col_counters_write_stats["tokens_written"] == 2
+
+    # Merging into existing tokens updates them, and new tokens are inserted
+    records = [{"unique_id": i, "value": "a" if i < 15 else "c"} for i in range(10, 20)]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=4)
+
+    sql = "select token, token_count from value_token_count_values order by token"
+    assert db.conn.execute(sql).fetchall() == [
+        {"token": "A", "token_count": 8},
+        {"token": "B", "token_count": 7},
+        {"token": "C", "token_count": 5},
+    ]
+    assert _proportion(db, "A") == 0.4
+
+    stats = db.last_col_counters_write_stats
+    assert stats["tokens_written"] == 2
+    assert stats["seconds"] >= 0
+    assert stats["tokens_per_second"] >= 0
+
+
+def test_merge_token_counts_raises_other_errors(monkeypatch):
+    def upsert_fails(c, col):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(
+        SearchDatabase, "_upsert_staged_token_counts", staticmethod(upsert_fails)
+    )
+
+    db = SearchDatabase()
+    records = [{"unique_id": i, "value": "a"} for i in range(10)]
+    with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+        db.write_list_dicts_parallel(records, unique_id_col="unique_id")
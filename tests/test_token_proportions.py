@@ -0,0 +1,81 @@
+from fuzzyfinder.cache import TokenProportionCache
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.finder import MatchFinder
+from fuzzyfinder.record import Record, get_token_proportion, get_token_proportions
+
+
+def _database(surnames):
+    db = SearchDatabase()
+    records = [
+        {"unique_id": f"prop_{i}", "first_name": "robin", "surname": s}
+        for i, s in enumerate(surnames)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+    return db
+
+
+def test_get_token_proportions():
+
+    db = _database(["linacre", "linacre", "smith", "jones"])
+
+    tokens = ["LINACRE", "SMITH", "LINACRE", "ZZZZ"]
+    proportions = get_token_proportions(tokens, "surname", db.conn)
+
+    assert list(proportions) == ["LINACRE", "SMITH", "ZZZZ"]
+    assert (
+        proportions["LINACRE"]["proportion"] == 2 * proportions["SMITH"]["proportion"]
+    )
+    assert proportions["ZZZZ"]["proportion"] == "does_not_exist_in_db"
+    for token in tokens:
+        assert get_token_proportion(token, "surname", db.conn) == proportions[token]
+
+    db.close()
+
+
+def test_token_probabilities_are_per_database():
+
+    db_1 = _database(["linacre", "smith"])
+    db_2 = _database(["linacre", "linacre", "linacre", "smith"])
+
+    record_dict = {"unique_id": "same_id", "first_name": "robin", "surname": "linacre"}
+    record_1 = Record(record_dict, "unique_id", db_1.conn)
+    record_2 = Record(record_dict, "unique_id", db_2.conn)
+
+    # Records with the same id must not share token probabilities across databases
+    p_1 = record_1.token_probabilities["surname"]["LINACRE"]["proportion"]
+    p_2 = record_2.token_probabilities["surname"]["LINACRE"]["proportion"]
+    assert p_2 > p_1
+
+    db_1.close()
+    db_2.close()
+
+
+def test_token_proportion_cache():
+
+    db = _database(["linacre", "smith"])
+    search_dict = {"first_name": "robin", "surname": "linacre"}
+
+    finder = MatchFinder(dict(search_dict), db)
+    p_before = finder.record.token_probabilities["surname"]["LINACRE"]["proportion"]
+    assert db.token_proportion_cache.get(("LINACRE", "surname")) is not None
+
+    # Writing records changes the token counts, so proportions must be looked up again
+    db.write_list_dicts_parallel(
+        [{"unique_id": "prop_new", "first_name": "robin", "surname": "linacre"}],
+        unique_id_col="unique_id",
+    )
+    assert len(db.token_proportion_cache) == 0
+    finder = MatchFinder(dict(search_dict), db)
+    p_after = finder.record.token_probabilities["surname"]["LINACRE"]["proportion"]
+    assert p_after > p_before
+
+    db.close()
+
+    # The least recently used proportions are dropped
+    cache = TokenProportionCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
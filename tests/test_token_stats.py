@@ -0,0 +1,80 @@
+import os
+import tempfile
+
+import pytest
+
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.record import Record
+from fuzzyfinder.token_stats import TokenStats, token_stats_path
+
+
+def _records(start, stop):
+    first_names = ["robin", "david", "john", "zoë"]
+    surnames = ["linacre", "smith", "jones"]
+    return [
+        {
+            "unique_id": f"stats_{i}",
+            "first_name": first_names[i % 4],
+            "surname": surnames[i % 3],
+        }
+        for i in range(start, stop)
+    ]
+
+
+def test_token_stats_snapshot():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+    db = SearchDatabase(db_filename)
+    db.write_list_dicts_parallel(_records(0, 50), unique_id_col="unique_id")
+
+    # There is no snapshot until the stats tables are built
+    assert db.token_stats() == {}
+
+    db.build_or_replace_stats_tables()
+    token_stats = db.token_stats()
+    assert set(token_stats) == {"first_name", "surname"}
+
+    # Every token's proportion matches the database
+    for col, stats in token_stats.items():
+        rows = db.conn.execute(
+            f"select token, token_proportion from {col}_token_counts"
+        ).fetchall()
+        assert len(stats) == len(rows)
+        for r in rows:
+            assert stats.get(r["token"]) == r["token_proportion"]
+    assert token_stats["surname"].get("ZZZZ") is None
+
+    record_dict = {"unique_id": "stats_search", "first_name": "zoë", "surname": "zzzz"}
+    from_snapshot = Record(record_dict, "unique_id", db.conn, token_stats=token_stats)
+    from_db = Record(record_dict, "unique_id", db.conn)
+    assert from_snapshot.token_probabilities == from_db.token_probabilities
+
+    # Writing more records makes the snapshot out of date
+    db.write_list_dicts_parallel(_records(50, 60), unique_id_col="unique_id")
+    assert db.token_stats() == {}
+
+    db.build_or_replace_stats_tables()
+    token_stats = db.token_stats()
+    assert len(token_stats) == 2
+
+    # A process opening the database uses the snapshot written by another
+    db_read = SearchDatabase(db_filename, read_only=True)
+    assert db_read.token_stats()["surname"].version == token_stats["surname"].version
+    results = db_read.find_potental_matches(
+        {"first_name": "robin", "surname": "linacre"}
+    )
+    assert len(results) > 0
+
+    db_read.close()
+    db.close()
+
+
+def test_corrupt_token_stats_file():
+
+    path = token_stats_path(tempfile.NamedTemporaryFile().name, "surname")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"not a token stats file" * 10)
+
+    with pytest.raises(ValueError):
+        TokenStats(path)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from fuzzyfinder.record import Record
+
+
+def test_tokenise_column_matches_tokenise_value():
+
+    values = [
+        "robin",
+        "Robin  Linacre",
+        "  ",
+        "",
+        None,
+        float("nan"),
+        1,
+        1.0,
+        True,
+        123456.789,
+        1.5e20,
+        "o'neill-smith",
+        "flat 3b, 12 high st.",
+        "ABC12345 12345ABCD",
+        "abcdefghijklmnopqrstuvwxyz",
+        "tab\tseparated\n\nnewlines",
+        "x" + " " * 150 + "y",
+        "null\x00byte",
+        "robin",
+        "émile ßtraße",
+    ]
+
+    # Call the underlying function rather than the cached one, since the lru_cache does not
+    # distinguish between e.g. 1 and True
+    expected = [Record.tokenise_value.__wrapped__(v) for v in values]
+
+    assert Record.tokenise_column(values) == expected
+
+    values_without_null_byte = [v for v in values if v != "null\x00byte"]
+    expected = [Record.tokenise_value.__wrapped__(v) for v in values_without_null_byte]
+    assert Record.tokenise_column(values_without_null_byte) == expected
+
+    series = pd.Series(["john smith", None, "jo-anne", "AB1234567"])
+    expected = [Record.tokenise_value.__wrapped__(v) for v in series.tolist()]
+    assert Record.tokenise_column(series) == expected
+
+    array = np.array([1.5, 2.25, np.nan, 1e10])
+    expected = [Record.tokenise_value.__wrapped__(v) for v in array.tolist()]
+    assert Record.tokenise_column(array) == expected
+
+    assert Record.tokenise_column([]) == []
@@ -0,0 +1,65 @@
+from fuzzyfinder.database import SearchDatabase
+from fuzzyfinder.finder import MatchFinder, _max_weight_avoiding
+
+
+def _database():
+    db = SearchDatabase()
+    first_names = ["robin", "david", "john", "sarah", "emma", "james"]
+    surnames = ["linacre", "smith", "jones", "taylor", "brown"]
+    records = [
+        {
+            "unique_id": f"topk_{i}",
+            "first_name": first_names[i % 6],
+            "surname": surnames[i % 5],
+            "city": f"city{i % 11}",
+            "street": f"street{i % 13}",
+        }
+        for i in range(500)
+    ]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id")
+    return db
+
+
+def test_top_k():
+
+    db = _database()
+    search_dict = {
+        "unique_id": "topk_search",
+        "first_name": "robin",
+        "surname": "linacre",
+        "city": "city6",
+        "street": "street10",
+    }
+
+    finder = MatchFinder(dict(search_dict), db, return_records_limit=500)
+    finder.find_potential_matches()
+    all_scores = sorted(
+        (r["score"] for r in finder.found_records.values()), reverse=True
+    )
+
+    top_finder = MatchFinder(dict(search_dict), db, return_records_limit=500, top_k=3)
+    top_finder.find_potential_matches()
+    top_scores = sorted(
+        (r["score"] for r in top_finder.found_records.values()), reverse=True
+    )
+
+    assert len(top_finder.found_records) == 3
+    assert top_scores == all_scores[:3]
+    assert top_finder.number_of_searches < finder.number_of_searches
+
+    # No record that wasn't found could have scored better than the third best
+    assert top_finder._best_possible_unseen_score() <= top_scores[-1]
+
+    df = db.find_potential_matches_as_pandas(search_dict, top_k=2)
+    assert len(df) == 2
+
+    db.close()
+
+
+def test_max_weight_avoiding():
+
+    weights = {"A": 3, "B": 2, "C": 1}
+    assert _max_weight_avoiding(weights, []) == 6
+    assert _max_weight_avoiding(weights, [frozenset("AB")]) == 4
+    assert _max_weight_avoiding(weights, [frozenset("AB"), frozenset("AC")]) == 3
+    assert _max_weight_avoiding(weights, [frozenset("A"), frozenset("BC")]) == 2
@@ -0,0 +1,98 @@
+from collections import Counter
+import multiprocessing
+import os
+import tempfile
+
+import pytest
+
+from fuzzyfinder.database import SearchDatabase
+
+
+def _worker_pid(_):
+    return os.getpid()
+
+
+def test_pool_is_reused_across_writes():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+
+    with SearchDatabase(db_filename, processes=2, maxtasksperchild=None) as db:
+        records = [{"unique_id": i, "value": "a"} for i in range(10)]
+        db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=3)
+
+        pool = db.pool
+        worker_pids = {p.pid for p in multiprocessing.active_children()}
+        assert len(worker_pids) == 2
+        assert set(pool.map(_worker_pid, range(20))) <= worker_pids
+
+        records = [{"unique_id": i, "value": "b"} for i in range(10, 20)]
+        db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=3)
+
+        # The same pool, and the same worker processes, serve the second write
+        assert db.pool is pool
+        assert {p.pid for p in multiprocessing.active_children()} == worker_pids
+
+        results = db.conn.execute("select count(*) as count from df").fetchall()
+        assert results[0]["count"] == 20
+
+        db.close_pool()
+        assert db._pool is None
+
+    db = SearchDatabase(db_filename, processes=1, start_method="spawn")
+    records = [{"unique_id": i, "value": "c"} for i in range(20, 25)]
+    db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=2)
+
+    results = db.conn.execute("select count(*) as count from df").fetchall()
+    assert results[0]["count"] == 25
+    db.close()
+
+
+def test_pending_batches_are_bounded():
+
+    db_filename = tempfile.NamedTemporaryFile().name
+
+    with SearchDatabase(db_filename, processes=2, max_pending_batches=3) as db:
+        records = ({"unique_id": i, "value": f"v{i % 7}"} for i in range(100))
+        db.write_records_iterable(records, unique_id_col="unique_id", batch_size=5)
+
+        stats = db.last_write_stats
+        assert stats["batches_written"] == 20
+        assert stats["records_written"] == 100
+        assert stats["peak_pending_batches"] <= 3
+        assert stats["writer_wait_seconds"] >= 0
+        assert stats["producer_wait_seconds"] >= 0
+
+    # A byte budget smaller than a single batch means batches are written one at a time
+    with SearchDatabase(max_pending_bytes=1) as db:
+        records = ({"unique_id": i, "value": f"v{i % 7}"} for i in range(100))
+        db.write_records_iterable(records, unique_id_col="unique_id", batch_size=5)
+
+        stats = db.last_write_stats
+        assert stats["records_written"] == 100
+        assert stats["peak_pending_batches"] == 1
+
+
+@pytest.mark.parametrize("maxtasksperchild", [None, 3])
+def test_workers_add_up_token_counts(maxtasksperchild):
+
+    with SearchDatabase(processes=2, maxtasksperchild=maxtasksperchild) as db:
+        records = [{"unique_id": i, "value": f"v{i % 7}"} for i in range(100)]
+        db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=5)
+
+        # Rather than one per batch, each worker sends its token counts once, unless it's replaced first
+        stats = db.last_write_stats
+        assert stats["batches_written"] == 20
+        if maxtasksperchild is None:
+            assert stats["column_counters_received"] <= 2
+        else:
+            assert stats["column_counters_received"] <= 20 // maxtasksperchild + 2
+
+        # Records whose unique ids are already in the database aren't counted
+        records = [{"unique_id": i, "value": "w"} for i in range(90, 110)]
+        db.write_list_dicts_parallel(records, unique_id_col="unique_id", batch_size=5)
+
+        sql = "select token, token_count from value_token_count_values"
+        counts = {r["token"]: r["token_count"] for r in db.conn.execute(sql)}
+        expected = Counter(f"V{i % 7}" for i in range(100))
+        expected["W"] = 10
+        assert counts == expected